@@ -3,10 +3,14 @@ from streamlit_ace import st_ace
 import sys
 import io
 import traceback
+import uuid
 from exercises import get_exercises, get_exercise_by_id
 from progress_tracker import ProgressTracker
-from code_executor import execute_code
-from code_quality import analyze_code_quality, format_feedback
+from code_executor import start_execution, start_tests, format_execution_stats, format_performance
+from sandbox_profiles import resolve_profile
+from reference_oracle import resolve_test_cases
+from code_quality import CodeQualityAnalyzer, analyze_code_quality, format_feedback
+from quality_rules import resolve_rules
 from concept_explanations import get_category_concepts, get_enhanced_hints
 from custom_exercises import CustomExerciseManager, get_difficulty_options, get_example_exercise_templates, validate_test_case
 from specialized_tracks import get_specialized_tracks
@@ -27,6 +31,18 @@ if 'code_content' not in st.session_state:
 if 'current_page' not in st.session_state:
     st.session_state.current_page = "exercises"
 
+# Identifies this browser session to the execution scheduler
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Handle of the run or submission in progress, so it can be cancelled
+if 'active_execution' not in st.session_state:
+    st.session_state.active_execution = None
+
+# Keeps per-block analysis results between edits for inline editor feedback
+if 'quality_analyzer' not in st.session_state:
+    st.session_state.quality_analyzer = CodeQualityAnalyzer()
+
 def main():
     st.set_page_config(
         page_title="Python Practice Platform",
@@ -50,6 +66,7 @@ def main():
         
         for page_key, page_name in page_options.items():
             if st.button(page_name, key=f"nav_{page_key}", use_container_width=True):
+                cancel_active_execution()
                 st.session_state.current_page = page_key
                 st.session_state.show_concepts = False
                 st.rerun()
@@ -104,6 +121,7 @@ def main():
                     use_container_width=True
                 ):
                     # Reset state when switching exercises
+                    cancel_active_execution()
                     if st.session_state.current_exercise_id != exercise['id']:
                         st.session_state.show_concepts = False
                     st.session_state.current_exercise_id = exercise['id']
@@ -129,6 +147,7 @@ def main():
                         use_container_width=True
                     ):
                         # Reset state when switching exercises
+                        cancel_active_execution()
                         if st.session_state.current_exercise_id != exercise['id']:
                             st.session_state.show_concepts = False
                         st.session_state.current_exercise_id = exercise['id']
@@ -217,12 +236,14 @@ def display_exercise():
         exercise = st.session_state.custom_exercise_manager.get_exercise_by_id(exercise_id)
     
     # If not found, try specialized tracks
+    track = None
     if not exercise:
         specialized_tracks = get_specialized_tracks()
         for track_data in specialized_tracks.values():
             for track_exercise in track_data['exercises']:
                 if track_exercise['id'] == exercise_id:
                     exercise = track_exercise
+                    track = track_data
                     break
             if exercise:
                 break
@@ -231,6 +252,9 @@ def display_exercise():
         st.error("Exercise not found!")
         return
     
+    # Quality rules enabled for this exercise and its track
+    quality_rules = resolve_rules(exercise, track)
+    
     # Exercise header
     col1, col2, col3 = st.columns([3, 1, 1])
     with col1:
@@ -273,17 +297,25 @@ def display_exercise():
     if not st.session_state.code_content and 'starter_code' in exercise:
         st.session_state.code_content = exercise['starter_code']
     
+    # Inline feedback for the latest editor contents; only the blocks
+    # changed since the last rerun are analyzed again
+    editor_key = f"editor_{exercise['id']}"
+    st.session_state.quality_analyzer.rules = quality_rules
+    annotations = st.session_state.quality_analyzer.analyze_incremental(
+        st.session_state.get(editor_key) or st.session_state.code_content
+    )
+    
     # Code editor
     code = st_ace(
         value=st.session_state.code_content,
         language='python',
         theme='monokai',
-        key=f"editor_{exercise['id']}",
+        key=editor_key,
         height=300,
         auto_update=True,
         font_size=14,
         wrap=False,
-        annotations=None
+        annotations=annotations
     )
     
     # Update session state
@@ -298,16 +330,55 @@ def display_exercise():
     
     with col2:
         if st.button("✅ Submit Solution"):
-            submit_solution(code, exercise)
+            submit_solution(code, exercise, quality_rules)
     
     with col3:
         if st.button("🔍 Check Quality"):
-            check_code_quality(code)
+            check_code_quality(code, quality_rules)
     
     with col4:
         if st.button("🔄 Reset Code"):
+            cancel_active_execution()
             st.session_state.code_content = exercise.get('starter_code', '')
             st.rerun()
+    
+    if st.session_state.pop('execution_stopped', False):
+        st.info("⏹️ Execution stopped.")
+
+def cancel_active_execution():
+    """Stop this session's run or submission if it is still in progress"""
+    handle = st.session_state.get('active_execution')
+    if handle is not None:
+        handle.cancel()
+        st.session_state.active_execution = None
+
+def stop_execution():
+    """Stop button callback"""
+    cancel_active_execution()
+    st.session_state.execution_stopped = True
+
+def wait_for_events(handle):
+    """Yield a background execution's events, offering a Stop button while it runs"""
+    st.session_state.active_execution = handle
+    status = st.empty()
+    stop = st.empty()
+    stop.button("⏹️ Stop", key="stop_execution", on_click=stop_execution)
+    
+    try:
+        for event in handle.iter_events(poll_interval=0.2):
+            if event is None:
+                # Updating the page while waiting is what lets Streamlit interrupt
+                # this script run when the user clicks Stop or navigates away
+                status.caption("⏳ Running...")
+                continue
+            yield event
+    finally:
+        # Also reached when Streamlit abandons this run, so the work stops with it
+        handle.cancel()
+        if st.session_state.get('active_execution') is handle:
+            st.session_state.active_execution = None
+        status.empty()
+        stop.empty()
 
 def run_code(code, exercise):
     """Execute the code and display output"""
@@ -318,22 +389,41 @@ def run_code(code, exercise):
     st.markdown("### 📤 Output")
     
     try:
-        # Execute the code
-        result = execute_code(code)
+        # Execute the code in the background so it can be stopped
+        handle = start_execution(code, priority="interactive", session_id=st.session_state.session_id,
+                                 **resolve_profile(exercise).to_limits())
+        
+        # Show output as it is printed; only the first max_output_bytes are streamed
+        output_area = st.empty()
+        streamed = []
+        result = None
+        for event in wait_for_events(handle):
+            if event['type'] == 'output':
+                streamed.append(event['text'])
+                output_area.code(''.join(streamed), language='text')
+            else:
+                result = event['result']
         
         if result['success']:
             if result['output']:
-                st.code(result['output'], language='text')
+                output_area.code(result['output'], language='text')
+                if result.get('truncated'):
+                    st.caption(
+                        f"Output truncated: showing the first {len(result['output'].encode('utf-8'))} of "
+                        f"{result['output_bytes']} bytes ({result['output_lines']} lines)"
+                    )
             else:
-                st.info("Code executed successfully (no output)")
+                output_area.info("Code executed successfully (no output)")
+            st.caption(f"⏱️ {format_execution_stats(result)}")
         else:
+            # Output printed before the error stays visible above it
             st.error("**Error occurred:**")
             st.code(result['error'], language='text')
             
     except Exception as e:
         st.error(f"Unexpected error: {str(e)}")
 
-def check_code_quality(code):
+def check_code_quality(code, quality_rules=None):
     """Analyze code quality and provide feedback"""
     if not code.strip():
         st.warning("Please write some code before checking quality!")
@@ -344,7 +434,7 @@ def check_code_quality(code):
     with st.spinner("Analyzing your code..."):
         try:
             # Analyze code quality
-            analysis = analyze_code_quality(code)
+            analysis = analyze_code_quality(code, quality_rules)
             feedback = format_feedback(analysis)
             
             # Display the formatted feedback
@@ -364,18 +454,27 @@ def check_code_quality(code):
         except Exception as e:
             st.error(f"Error analyzing code quality: {str(e)}")
 
-def submit_solution(code, exercise):
+def submit_solution(code, exercise, quality_rules=None):
     """Submit and validate the solution"""
     if not code.strip():
         st.warning("Please write some code before submitting!")
         return
     
-    # Execute the code first
-    result = execute_code(code)
-    
-    if not result['success']:
+    # Run the program once and every test case against the state it leaves behind;
+    # the first event is the program's own result, then tests arrive as they finish.
+    # Expected outputs come from the reference solution where one was recorded
+    handle = start_tests(code, resolve_test_cases(exercise),
+                         priority="submit", session_id=st.session_state.session_id,
+                         **resolve_profile(exercise).to_limits())
+    events = wait_for_events(handle)
+    program = next(events)['result']
+    
+    if not program['success']:
+        # Drain the remaining events so the sandbox worker is released cleanly
+        for _ in events:
+            pass
         st.error("Your code has errors. Please fix them before submitting.")
-        st.code(result['error'], language='text')
+        st.code(program['error'], language='text')
         return
     
     # Check if exercise has test cases
@@ -385,35 +484,43 @@ def submit_solution(code, exercise):
         
         st.markdown("### 🧪 Running Tests...")
         
-        for i, test_case in enumerate(exercise['test_cases']):
-            test_code = code + "\n" + test_case['test']
-            test_result = execute_code(test_code)
+        # Render each test as soon as its result arrives
+        for event in events:
+            test = event['detail']
+            i = test['test_number'] - 1
             
-            if test_result['success']:
-                expected = test_case.get('expected', '')
-                actual = test_result['output'].strip()
-                
-                # Check if this is an assertion-based test (no expected output)
-                if not expected or expected.lower() in ['', 'none', 'no output']:
+            if test['passed']:
+                passed_tests += 1
+                if 'vectors' in test:
+                    # Batch tests check many inputs of one function at once
+                    st.success(f"✅ Test {i+1}: Passed ({test['actual']})")
+                elif test['assertion']:
                     # For assertion-based tests, success means the test passed
                     st.success(f"✅ Test {i+1}: Passed (assertion test)")
-                    passed_tests += 1
-                elif actual == expected:
+                else:
                     # For output-comparison tests
                     st.success(f"✅ Test {i+1}: Passed")
-                    passed_tests += 1
-                else:
-                    st.error(f"❌ Test {i+1}: Failed")
-                    st.write(f"Expected: `{expected}`")
-                    st.write(f"Got: `{actual}`")
+            elif 'vectors' in test and not test['error']:
+                st.error(f"❌ Test {i+1}: Failed ({test['actual']})")
+                failing = [vector for vector in test['vectors'] if not vector['passed']]
+                # A handful of failing inputs is enough to go on
+                st.table(failing[:10])
+            elif not test['error']:
+                st.error(f"❌ Test {i+1}: Failed")
+                st.write(f"Expected: `{test['expected']}`")
+                st.write(f"Got: `{test['actual']}`")
             else:
                 # Check if this is an assertion error (expected for assertion tests)
-                if 'AssertionError' in test_result['error']:
+                if 'AssertionError' in test['error']:
                     st.error(f"❌ Test {i+1}: Assertion failed")
-                    st.code(test_result['error'], language='text')
+                    st.code(test['error'], language='text')
                 else:
                     st.error(f"❌ Test {i+1}: Error occurred")
-                    st.code(test_result['error'], language='text')
+                    st.code(test['error'], language='text')
+            
+            st.caption(f"⏱️ {format_execution_stats(test)}")
+            if test.get('performance'):
+                st.caption(f"🏎️ {format_performance(test['performance'])}")
         
         # Check if all tests passed
         if passed_tests == total_tests:
@@ -425,7 +532,7 @@ def submit_solution(code, exercise):
             # Provide code quality feedback on successful completion
             with st.expander("📊 Code Quality Feedback"):
                 try:
-                    analysis = analyze_code_quality(code)
+                    analysis = analyze_code_quality(code, quality_rules)
                     feedback = format_feedback(analysis)
                     st.markdown(feedback)
                 except Exception as e:
@@ -434,6 +541,10 @@ def submit_solution(code, exercise):
             st.warning(f"You passed {passed_tests}/{total_tests} tests. Keep trying!")
     
     else:
+        # Let the sandbox worker finish the job
+        for _ in events:
+            pass
+        
         # No test cases, just mark as completed if code runs
         st.success("🎉 Solution submitted successfully!")
         st.session_state.progress_tracker.mark_completed(exercise['id'])
@@ -442,7 +553,7 @@ def submit_solution(code, exercise):
         # Provide code quality feedback
         with st.expander("📊 Code Quality Feedback"):
             try:
-                analysis = analyze_code_quality(code)
+                analysis = analyze_code_quality(code, quality_rules)
                 feedback = format_feedback(analysis)
                 st.markdown(feedback)
             except Exception as e:
@@ -655,6 +766,7 @@ def display_custom_exercises():
             with col2:
                 if st.button("📝 Practice", key=f"practice_{exercise['id']}"):
                     # Switch to this custom exercise
+                    cancel_active_execution()
                     st.session_state.current_page = "exercises"
                     st.session_state.current_exercise_id = exercise['id']
                     st.session_state.code_content = exercise.get('starter_code', '')
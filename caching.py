@@ -0,0 +1,98 @@
+"""
+Bounded in-memory caches shared across sessions of the Python practice platform
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+def content_hash(*parts: str) -> str:
+    """
+    Hash one or more strings into a stable cache key
+
+    Args:
+        parts: Strings that together identify the cached content
+
+    Returns:
+        Hex digest of the parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8', 'surrogatepass'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with optional time-to-live and hit/miss counters"""
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None):
+        """
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Seconds an entry stays valid, or None to keep entries until evicted
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry if full"""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, computing and storing it on a miss
+
+        compute() runs outside the lock, so two threads missing the same key
+        at once may both compute it; the last one stored wins.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -2,246 +2,2033 @@
 Code execution functionality for the Python practice platform
 """
 
-import sys
 import io
-import traceback
-import contextlib
+import os
+import sys
+import ast
+import math
+import operator
+import copy
+import json
+import time
+import queue
+import pickle
+import marshal
+import select
 import signal
-from typing import Dict, Any
+import atexit
+import threading
+import traceback
+import importlib
+import tracemalloc
+from types import CodeType, ModuleType
+from collections import deque
+from typing import Dict, Any, Callable, Iterator
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from caching import LRUCache, content_hash
+from sandbox_pool import SandboxPool, WorkerTimeout, WorkerCrashed
+from execution_watchdog import get_watchdog, interrupt_thread, absorb_interrupt, CancelToken, ExecutionCancelled
+from execution_scheduler import ExecutionScheduler, SchedulerBusy
 
 class TimeoutException(Exception):
     pass
 
-def timeout_handler(signum, frame):
-    raise TimeoutException("Code execution timed out")
+class CPULimitExceeded(Exception):
+    pass
 
-def execute_code(code: str, timeout: int = 5) -> Dict[str, Any]:
+class OutputLimitExceeded(Exception):
+    pass
+
+class LineBudgetExceeded(Exception):
+    pass
+
+class _ExecutionDeadline:
+    """Interrupts the calling thread with TimeoutException once its deadline passes"""
+    
+    def __init__(self, timeout: float):
+        self._thread_id = threading.get_ident()
+        self._lock = threading.Lock()
+        self._running = True
+        self._fired = False
+        self._watchdog = get_watchdog()
+        self._token = self._watchdog.watch(timeout, self._on_deadline)
+    
+    def _on_deadline(self):
+        with self._lock:
+            if self._running:
+                self._fired = True
+                interrupt_thread(self._thread_id, TimeoutException)
+    
+    def disarm(self):
+        """Stop the deadline; must be called from the executing thread"""
+        self._watchdog.cancel(self._token)
+        with self._lock:
+            self._running = False
+        if self._fired:
+            # Drop the exception if it has not been delivered yet
+            absorb_interrupt(TimeoutException)
+
+class _CancelInterrupt:
+    """Interrupts the calling thread with ExecutionCancelled when a token is cancelled"""
+    
+    def __init__(self, cancel_token: CancelToken | None):
+        self._cancel_token = cancel_token
+        self._thread_id = threading.get_ident()
+    
+    def _on_cancel(self):
+        interrupt_thread(self._thread_id, ExecutionCancelled)
+    
+    def __enter__(self):
+        if self._cancel_token is not None:
+            self._cancel_token.add_callback(self._on_cancel)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._cancel_token is not None:
+            self._cancel_token.remove_callback(self._on_cancel)
+            if self._cancel_token.cancelled:
+                # Drop the exception if it has not been delivered yet
+                absorb_interrupt(ExecutionCancelled)
+        return False
+
+class BoundedOutput(io.TextIOBase):
     """
-    Safely execute Python code and return the result
+    Output buffer that keeps at most max_bytes of text
     
-    Args:
-        code: Python code to execute
-        timeout: Maximum execution time in seconds
+    Everything written is counted, but only the first max_bytes are kept,
+    so runaway output costs constant memory. Writing more than limit_bytes
+    in total stops the program with OutputLimitExceeded.
     
-    Returns:
-        Dictionary with success status, output, and error information
+    With on_flush set, kept text is also passed to it in chunks as it is
+    written: once STREAM_CHUNK_BYTES are pending, whenever a line ends at
+    least STREAM_FLUSH_INTERVAL seconds after the last chunk (so the first
+    line goes out at once), and on flush().
+    """
+    
+    def __init__(self, max_bytes: int, limit_bytes: int | None = None,
+                 on_flush: Callable[[str], None] | None = None):
+        self.max_bytes = max_bytes
+        self.limit_bytes = limit_bytes
+        self.bytes_written = 0
+        self.lines_written = 0
+        self.truncated = False
+        self._chunks = []
+        self._kept = 0
+        self._on_flush = on_flush
+        self._flushed = 0
+        self._flushed_bytes = 0
+        self._last_flush = 0.0
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, text: str) -> int:
+        size = len(text) if text.isascii() else len(text.encode('utf-8', 'replace'))
+        self.bytes_written += size
+        self.lines_written += text.count('\n')
+        if self.limit_bytes is not None and self.bytes_written > self.limit_bytes:
+            self.truncated = True
+            raise OutputLimitExceeded(f"Output exceeded {self.limit_bytes} bytes")
+        
+        room = self.max_bytes - self._kept
+        if size <= room:
+            self._chunks.append(text)
+            self._kept += size
+        else:
+            self.truncated = True
+            if room > 0:
+                self._chunks.append(text.encode('utf-8', 'replace')[:room].decode('utf-8', 'ignore'))
+                self._kept = self.max_bytes
+        
+        if self._on_flush is not None and (
+            self._kept - self._flushed_bytes >= STREAM_CHUNK_BYTES
+            or (text.endswith('\n') and time.monotonic() - self._last_flush >= STREAM_FLUSH_INTERVAL)
+        ):
+            self.flush()
+        return len(text)
+    
+    def flush(self):
+        """Pass kept text not yet streamed to on_flush"""
+        if self._on_flush is None or self._flushed == len(self._chunks):
+            return
+        pending = ''.join(self._chunks[self._flushed:])
+        self._flushed = len(self._chunks)
+        self._flushed_bytes = self._kept
+        self._last_flush = time.monotonic()
+        self._on_flush(pending)
+    
+    def getvalue(self) -> str:
+        return ''.join(self._chunks)
+
+def _check_attribute_name(name: Any):
+    """Refuse private attribute names and those SAFETY_POLICY lists, however the name was built"""
+    if isinstance(name, str) and (name.startswith('_') or name in SAFETY_POLICY["attribute"]):
+        raise AttributeError(f"Attribute '{name}' is not available in the practice sandbox")
+
+def _sandbox_getattr(obj: Any, name: str, *default: Any) -> Any:
+    _check_attribute_name(name)
+    return getattr(obj, name, *default)
+
+def _sandbox_setattr(obj: Any, name: str, value: Any):
+    _check_attribute_name(name)
+    setattr(obj, name, value)
+
+def _sandbox_delattr(obj: Any, name: str):
+    _check_attribute_name(name)
+    delattr(obj, name)
+
+def _sandbox_hasattr(obj: Any, name: str) -> bool:
+    try:
+        _check_attribute_name(name)
+    except AttributeError:
+        return False
+    return hasattr(obj, name)
+
+def _sandbox_attrgetter(*names: str) -> Callable:
+    for name in names:
+        for part in name.split('.') if isinstance(name, str) else ():
+            _check_attribute_name(part)
+    return operator.attrgetter(*names)
+
+def _sandbox_methodcaller(name: str, *args: Any, **kwargs: Any) -> Callable:
+    _check_attribute_name(name)
+    return operator.methodcaller(name, *args, **kwargs)
+
+# Restricted set of built-ins available to learner code
+SAFE_BUILTINS = {
+    # Safe built-ins
+    'print': print,
+    'len': len,
+    'range': range,
+    'enumerate': enumerate,
+    'zip': zip,
+    'map': map,
+    'filter': filter,
+    'sorted': sorted,
+    'sum': sum,
+    'min': min,
+    'max': max,
+    'abs': abs,
+    'round': round,
+    'int': int,
+    'float': float,
+    'str': str,
+    'bool': bool,
+    'list': list,
+    'dict': dict,
+    'tuple': tuple,
+    'set': set,
+    'type': type,
+    'isinstance': isinstance,
+    # Dynamic attribute access, limited to the names obj.name could reach
+    'hasattr': _sandbox_hasattr,
+    'getattr': _sandbox_getattr,
+    'setattr': _sandbox_setattr,
+    'delattr': _sandbox_delattr,
+    'dir': dir,
+    'help': help,
+    'repr': repr,
+    'ord': ord,
+    'chr': chr,
+    'any': any,
+    'all': all,
+    # Classes: the class statement calls __build_class__
+    '__build_class__': __build_class__,
+    'object': object,
+    'super': super,
+    'property': property,
+    'classmethod': classmethod,
+    'staticmethod': staticmethod,
+    # Math operations
+    'pow': pow,
+    'divmod': divmod,
+    # Exceptions
+    'Exception': Exception,
+    'ValueError': ValueError,
+    'TypeError': TypeError,
+    'IndexError': IndexError,
+    'KeyError': KeyError,
+    'AttributeError': AttributeError,
+    'ZeroDivisionError': ZeroDivisionError,
+    # Common modules (need to be imported explicitly)
+}
+
+TIMEOUT_MESSAGE = "Code execution timed out. Make sure your code doesn't have infinite loops."
+
+# Standard library modules learner code may import. sys, os and anything
+# else that reaches outside the sandbox are deliberately left out.
+SANDBOX_MODULES = (
+    'bisect', 'collections', 'collections.abc', 'copy', 'dataclasses',
+    'datetime', 'decimal', 'enum', 'fractions', 'functools', 'heapq',
+    'itertools', 'json', 'math', 'operator', 'random', 're', 'statistics',
+    'string', 'textwrap', 'time', 'typing',
+)
+
+# Default per-execution limits; any of them can be overridden per call
+DEFAULT_LIMITS = {
+    # Output kept in the result; anything beyond is counted but dropped
+    "max_output_bytes": 64 * 1024,
+    # Total output after which the program is stopped
+    "output_limit_bytes": 10 * 1024 * 1024,
+    # Extra address space a worker may allocate while running the code
+    "memory_limit_mb": 256,
+    # CPU seconds the code may use (None means the same as the timeout)
+    "cpu_limit": None,
+    # Lines of learner code that may execute (None disables counting)
+    "line_budget": None,
+    # Modules import statements may load, a subset of SANDBOX_MODULES
+    "allowed_modules": SANDBOX_MODULES,
+}
+
+# Streamed output is sent once this much is pending, or this long after the last chunk
+STREAM_CHUNK_BYTES = 4096
+STREAM_FLUSH_INTERVAL = 0.1
+
+# Filename learner code is compiled under; the line budget only counts these frames
+USER_CODE_FILENAME = '<string>'
+
+# Extra seconds the pool waits before killing a worker whose own deadline did not fire
+WORKER_GRACE_PERIOD = 1.0
+
+# A worker is replaced after this many jobs, or once its memory has grown
+# this much, so garbage left behind by learner code cannot pile up
+WORKER_MAX_TASKS = 500
+WORKER_MAX_RSS_GROWTH_MB = 128
+
+# Most test children one tests job runs at once. Each child may use the
+# full memory limit, and every pool worker can be running a tests job
+MAX_PARALLEL_TESTS = 2
+
+# Compiled code objects keyed by a hash of their source
+_compile_cache = LRUCache(maxsize=1024)
+
+# Sandbox modules whose results change between runs; grading verdicts
+# for code importing them are not cached
+NONDETERMINISTIC_MODULES = ('random', 'time', 'datetime')
+
+# Grading results keyed by (normalized AST hash, test cases hash, sandbox profile)
+_grading_cache = LRUCache(maxsize=512, ttl=600)
+
+def _public_attributes(module: ModuleType) -> Dict[str, Any]:
+    """Public names of a module, leaving out the modules it imported itself"""
+    return {
+        name: value for name, value in vars(module).items()
+        if not name.startswith('_') and not isinstance(value, ModuleType)
+    }
+
+# Public contents of each sandbox module, imported once here so forked
+# workers inherit them and an import inside learner code costs a dict copy
+_sandbox_module_attributes = {
+    name: _public_attributes(importlib.import_module(name)) for name in SANDBOX_MODULES
+}
+# operator's attribute helpers are getattr() by another name
+_sandbox_module_attributes['operator'].update(
+    attrgetter=_sandbox_attrgetter,
+    methodcaller=_sandbox_methodcaller
+)
+
+# Set in sandbox worker processes, which run one execution at a time under
+# rlimits, so process-wide memory measurements belong to that execution
+_in_sandbox_worker = False
+
+# Resident set size in bytes when this process was forked by _ForkedChild
+# inside a sandbox worker; peak memory is measured from here
+_fork_rss = None
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_workers = None
+
+# Admits executions into the pool by priority lane; sized to match the pool
+_scheduler = None
+
+def _make_limits(timeout: float, **overrides) -> Dict[str, Any]:
+    """Collect the per-execution limits passed down to the sandbox"""
+    unknown = set(overrides) - set(DEFAULT_LIMITS)
+    if unknown:
+        raise TypeError(f"Unknown sandbox limit(s): {', '.join(sorted(unknown))}")
+    
+    limits = dict(DEFAULT_LIMITS, timeout=timeout, **overrides)
+    if limits["cpu_limit"] is None:
+        limits["cpu_limit"] = timeout
+    
+    unavailable = set(limits["allowed_modules"]) - set(SANDBOX_MODULES)
+    if unavailable:
+        raise ValueError(f"Module(s) not available in the sandbox: {', '.join(sorted(unavailable))}")
+    limits["allowed_modules"] = tuple(sorted(limits["allowed_modules"]))
+    return limits
+
+def _current_address_space() -> int | None:
+    """Virtual memory size of this process in bytes, if the platform reports it"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _cpu_limit_handler(signum, frame):
+    raise CPULimitExceeded("CPU time limit exceeded")
+
+class _ResourceLimits:
+    """
+    Applies memory, CPU and file-size rlimits around one execution
+    
+    Only used inside sandbox worker processes: the limits are relative to
+    what the process already uses and are lifted again afterwards, but
+    they would still affect every thread of the server if applied there.
+    """
+    
+    def __init__(self, limits: Dict[str, Any]):
+        self._limits = limits
+        self._saved = {}
+    
+    def _set(self, which: int, soft: int):
+        old_soft, hard = resource.getrlimit(which)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(which, (soft, hard))
+        self._saved[which] = old_soft
+    
+    def __enter__(self):
+        if resource is None:
+            return self
+        
+        memory_limit_mb = self._limits.get("memory_limit_mb")
+        address_space = _current_address_space()
+        if memory_limit_mb and address_space is not None:
+            self._set(resource.RLIMIT_AS, address_space + memory_limit_mb * 1024 * 1024)
+        
+        cpu_limit = self._limits.get("cpu_limit")
+        if cpu_limit:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            self._set(resource.RLIMIT_CPU, math.ceil(usage.ru_utime + usage.ru_stime + cpu_limit))
+        
+        # Learner code never needs to write files
+        self._set(resource.RLIMIT_FSIZE, 0)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        for which, soft in self._saved.items():
+            resource.setrlimit(which, (soft, resource.getrlimit(which)[1]))
+        self._saved = {}
+        return False
+
+def _cpu_times() -> tuple:
+    """User and system CPU seconds used so far by the calling thread (or process)"""
+    if resource is None:
+        times = os.times()
+        return times.user, times.system
+    usage = resource.getrusage(getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF))
+    return usage.ru_utime, usage.ru_stime
+
+class _Measurement:
+    """
+    Records wall time, CPU time and peak memory of one execution
+    
+    With memory="rss" (the default), peak memory is how far the forked
+    child running the execution has grown since the fork, read from
+    ru_maxrss at no cost while the code runs. memory="tracemalloc" counts
+    the execution's own allocations but slows allocation-heavy code down
+    several times, so it is kept for runs that must be compared within
+    one process. Both are only measured inside sandbox workers.
+    """
+    
+    def __init__(self, memory: str | None = "rss"):
+        """
+        Args:
+            memory: "rss", "tracemalloc", or None to leave peak memory unmeasured
+        """
+        self.wall_time = 0.0
+        self.cpu_user = 0.0
+        self.cpu_system = 0.0
+        self.peak_memory = None
+        self.memory = memory
+    
+    def __enter__(self):
+        self._track_memory = (self.memory == "tracemalloc" and _in_sandbox_worker
+                              and not tracemalloc.is_tracing())
+        if self._track_memory:
+            tracemalloc.start()
+        self._cpu_start = _cpu_times()
+        self._wall_start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.wall_time = time.perf_counter() - self._wall_start
+        user, system = _cpu_times()
+        self.cpu_user = user - self._cpu_start[0]
+        self.cpu_system = system - self._cpu_start[1]
+        if self._track_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        elif self.memory == "rss" and _fork_rss is not None:
+            self.peak_memory = max(0, _max_rss() - _fork_rss)
+        return False
+
+def _max_rss() -> int:
+    """High-water mark of this process's resident set in bytes (ru_maxrss is in KiB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class _LineBudget:
+    """
+    Counts executed lines of learner code and stops it past the budget
+    
+    Unlike a wall-clock timeout, the count does not depend on how busy the
+    machine is, so verdicts are reproducible. A line counts each time
+    execution moves onto it, and every backward jump counts once more, so
+    loops that fit on one line (while True: pass) still use up the budget.
+    
+    Inside sandbox workers on Python 3.12+ it uses sys.monitoring LINE and
+    JUMP events; elsewhere it falls back to a sys.settrace tracer with
+    opcode events, which only affects the calling thread. Both give the
+    same count for the same code.
+    """
+    
+    def __init__(self, budget: int | None, monitoring: bool | None = None):
+        """
+        Args:
+            budget: Lines that may execute, or None to count nothing
+            monitoring: Force sys.monitoring (True) or sys.settrace (False);
+                None picks sys.monitoring only inside sandbox workers
+        """
+        self.budget = budget
+        self.lines = 0
+        self.exceeded = False
+        self._use_monitoring = monitoring
+        self._monitoring = False
+    
+    def _count_line(self):
+        self.lines += 1
+        if self.lines > self.budget:
+            self.exceeded = True
+            raise LineBudgetExceeded(f"Executed more than {self.budget} lines")
+    
+    def _on_line(self, code, line_number):
+        if code.co_filename != USER_CODE_FILENAME:
+            return sys.monitoring.DISABLE
+        self._count_line()
+    
+    def _on_jump(self, code, instruction_offset, destination_offset):
+        if code.co_filename != USER_CODE_FILENAME:
+            return sys.monitoring.DISABLE
+        # A loop on one line can jump to the jump itself
+        if destination_offset <= instruction_offset:
+            self._count_line()
+    
+    def _trace_call(self, frame, event, arg):
+        if frame.f_code.co_filename != USER_CODE_FILENAME:
+            return None
+        if frame.f_trace is not None:
+            # A resumed generator keeps the position it stopped at
+            return frame.f_trace
+        
+        frame.f_trace_lines = False
+        frame.f_trace_opcodes = True
+        # Line and offset of the last instruction executed in this frame
+        position = [None, -1]
+        
+        def trace_opcode(frame, event, arg):
+            if event == 'opcode':
+                line, offset = frame.f_lineno, frame.f_lasti
+                if line != position[0]:
+                    position[0] = line
+                    self._count_line()
+                if offset <= position[1]:
+                    self._count_line()
+                position[1] = offset
+            return trace_opcode
+        return trace_opcode
+    
+    def _release_monitoring(self):
+        monitoring = sys.monitoring
+        monitoring.set_events(monitoring.PROFILER_ID, monitoring.events.NO_EVENTS)
+        monitoring.register_callback(monitoring.PROFILER_ID, monitoring.events.LINE, None)
+        monitoring.register_callback(monitoring.PROFILER_ID, monitoring.events.JUMP, None)
+        monitoring.free_tool_id(monitoring.PROFILER_ID)
+    
+    def __enter__(self):
+        if self.budget is None:
+            return self
+        
+        # sys.monitoring events are process-wide, so only use them where
+        # executions never overlap
+        self._monitoring = self._use_monitoring
+        if self._monitoring is None:
+            self._monitoring = _in_sandbox_worker and hasattr(sys, 'monitoring')
+        if self._monitoring:
+            monitoring = sys.monitoring
+            if monitoring.get_tool(monitoring.PROFILER_ID) == "line-budget":
+                # A run interrupted while cleaning up left its tool behind
+                self._release_monitoring()
+            monitoring.use_tool_id(monitoring.PROFILER_ID, "line-budget")
+            monitoring.register_callback(monitoring.PROFILER_ID, monitoring.events.LINE, self._on_line)
+            monitoring.register_callback(monitoring.PROFILER_ID, monitoring.events.JUMP, self._on_jump)
+            monitoring.set_events(monitoring.PROFILER_ID, monitoring.events.LINE | monitoring.events.JUMP)
+            # Locations disabled by an earlier run may be user code this time
+            monitoring.restart_events()
+        else:
+            sys.settrace(self._trace_call)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.budget is None:
+            return False
+        
+        if self._monitoring:
+            self._release_monitoring()
+        else:
+            sys.settrace(None)
+        
+        if self.exceeded and exc_type is None:
+            # The learner's code caught the exception; the verdict still stands
+            raise LineBudgetExceeded(f"Executed more than {self.budget} lines")
+        return False
+
+def _init_sandbox_worker():
+    """Turn on rlimits and memory tracking for this process; called in each worker"""
+    global _in_sandbox_worker
+    if _in_sandbox_worker:
+        return
+    _in_sandbox_worker = True
+    
+    if resource is None:
+        return
+    
+    # Exceeding the soft CPU limit raises in the executing (main) thread;
+    # exceeding the file size limit fails the write instead of killing us
+    signal.signal(signal.SIGXCPU, _cpu_limit_handler)
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+def _make_import(allowed_modules: tuple) -> Callable:
     """
+    Build an __import__ that only hands out the allowed sandbox modules
     
-    # Create a string buffer to capture output
-    output_buffer = io.StringIO()
-    error_buffer = io.StringIO()
+    Each execution gets its own module objects filled from the preloaded
+    attributes, so one run reassigning math.pi cannot affect the next. The
+    classes and functions in them are shared, though: pool workers run
+    every job in a forked child so that patching one (Counter.most_common,
+    say) is thrown away with it.
+    """
+    allowed = set(allowed_modules)
+    views = {}
+    
+    def view(name: str) -> ModuleType:
+        module = views.get(name)
+        if module is None:
+            module = ModuleType(name)
+            module.__dict__.update(_sandbox_module_attributes[name])
+            views[name] = module
+            for child in allowed:
+                parent, _, child_name = child.rpartition('.')
+                if parent == name:
+                    setattr(module, child_name, view(child))
+        return module
+    
+    def sandbox_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            raise ImportError("Relative imports are not supported here")
+        top_level = name.partition('.')[0]
+        if name not in allowed or top_level not in allowed:
+            raise ImportError(
+                f"Module '{name}' is not available. You can import: {', '.join(sorted(allowed))}",
+                name=name
+            )
+        return view(name) if fromlist else view(top_level)
     
-    # Store original stdout and stderr
-    original_stdout = sys.stdout
-    original_stderr = sys.stderr
+    return sandbox_import
+
+def _make_builtins(output_buffer: BoundedOutput, allowed_modules: tuple) -> Dict[str, Any]:
+    """Copy the safe built-ins with print() bound to the given buffer"""
+    def sandbox_print(*args, **kwargs):
+        kwargs.setdefault('file', output_buffer)
+        print(*args, **kwargs)
     
-    result = {
+    builtins = dict(SAFE_BUILTINS)
+    builtins['print'] = sandbox_print
+    builtins['__import__'] = _make_import(allowed_modules)
+    return builtins
+
+def _new_result() -> Dict[str, Any]:
+    return {
         "success": False,
         "output": "",
         "error": "",
-        "execution_time": 0
+        "execution_time": 0,
+        "cpu_user": 0.0,
+        "cpu_system": 0.0,
+        "peak_memory": None,
+        "lines_executed": None,
+        "truncated": False,
+        "output_bytes": 0,
+        "output_lines": 0,
+        "limit_exceeded": None
     }
+
+def format_execution_error(e: BaseException) -> str:
+    """
+    Turn an exception raised by learner code into a friendly error message
+    
+    Args:
+        e: The exception that was raised
     
+    Returns:
+        Error message shown to the learner
+    """
+    if isinstance(e, TimeoutException):
+        return TIMEOUT_MESSAGE
+    if isinstance(e, ExecutionCancelled):
+        return "Execution Cancelled: The run was stopped before it finished."
+    if isinstance(e, MemoryError):
+        return "Memory Limit Exceeded: Your program tried to use too much memory.\nLook for very large lists or strings."
+    if isinstance(e, CPULimitExceeded):
+        return "CPU Time Limit Exceeded: Your program used too much CPU time.\nMake sure your code doesn't have infinite loops."
+    if isinstance(e, OutputLimitExceeded):
+        return "Output Limit Exceeded: Your program printed too much output.\nMake sure your loops stop printing."
+    if isinstance(e, LineBudgetExceeded):
+        return f"Step Limit Exceeded: {str(e)}.\nMake sure your code doesn't have infinite loops, or look for a more efficient approach."
+    if isinstance(e, SyntaxError):
+        return f"Syntax Error: {str(e)}\nLine {e.lineno}: {e.text if e.text else 'N/A'}"
+    if isinstance(e, ImportError):
+        return f"Import Error: {str(e)}"
+    if isinstance(e, NameError):
+        return f"Name Error: {str(e)}\nMake sure all variables and functions are defined."
+    if isinstance(e, ZeroDivisionError):
+        return f"Division by Zero Error: {str(e)}\nYou cannot divide by zero."
+    if isinstance(e, IndexError):
+        return f"Index Error: {str(e)}\nYou're trying to access an index that doesn't exist."
+    if isinstance(e, KeyError):
+        return f"Key Error: {str(e)}\nThe dictionary key you're looking for doesn't exist."
+    if isinstance(e, TypeError):
+        return f"Type Error: {str(e)}\nCheck the data types you're working with."
+    if isinstance(e, ValueError):
+        return f"Value Error: {str(e)}\nThe value provided is not appropriate for the operation."
+    
+    # Capture the full traceback for unexpected errors, leaving out chained
+    # exceptions so none the server was handling can show up
+    tb_str = ''.join(traceback.format_exception(type(e), e, e.__traceback__, chain=False))
+    return f"Runtime Error: {str(e)}\n\nFull traceback:\n{tb_str}"
+
+def _limit_exceeded(e: BaseException) -> str | None:
+    """Name the sandbox limit an exception represents, if any"""
+    if isinstance(e, TimeoutException):
+        return "timeout"
+    if isinstance(e, MemoryError):
+        return "memory"
+    if isinstance(e, CPULimitExceeded):
+        return "cpu"
+    if isinstance(e, OutputLimitExceeded):
+        return "output"
+    if isinstance(e, LineBudgetExceeded):
+        return "line_budget"
+    if isinstance(e, ExecutionCancelled):
+        return "cancelled"
+    return None
+
+def compile_code(source: str, filename: str = USER_CODE_FILENAME) -> CodeType:
+    """
+    Compile source to a code object, reusing a cached one for identical source
+    
+    Args:
+        source: Python source code
+        filename: Filename shown in tracebacks and syntax errors
+    
+    Returns:
+        The compiled code object
+    
+    Raises:
+        SyntaxError: The source does not compile (failures are not cached)
+    """
+    return _compile_cache.get_or_compute(
+        content_hash(source, filename),
+        lambda: compile(source, filename, 'exec')
+    )
+
+def get_compile_cache_stats() -> Dict[str, Any]:
+    """Return size and hit/miss counters of the compiled code cache"""
+    return _compile_cache.stats()
+
+def _marshal_code(source: str) -> bytes | None:
+    """Compile source through the cache and serialize it for a worker, or None on a syntax error"""
     try:
-        # Set up timeout (only on Unix-like systems)
-        if hasattr(signal, 'SIGALRM'):
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)
-        
-        # Redirect stdout and stderr
-        sys.stdout = output_buffer
-        sys.stderr = error_buffer
-        
-        # Create a restricted execution environment
-        exec_globals = {
-            '__builtins__': {
-                # Safe built-ins
-                'print': print,
-                'len': len,
-                'range': range,
-                'enumerate': enumerate,
-                'zip': zip,
-                'map': map,
-                'filter': filter,
-                'sorted': sorted,
-                'sum': sum,
-                'min': min,
-                'max': max,
-                'abs': abs,
-                'round': round,
-                'int': int,
-                'float': float,
-                'str': str,
-                'bool': bool,
-                'list': list,
-                'dict': dict,
-                'tuple': tuple,
-                'set': set,
-                'type': type,
-                'isinstance': isinstance,
-                'hasattr': hasattr,
-                'getattr': getattr,
-                'setattr': setattr,
-                'dir': dir,
-                'help': help,
-                'repr': repr,
-                'ord': ord,
-                'chr': chr,
-                'any': any,
-                'all': all,
-                # Math operations
-                'pow': pow,
-                'divmod': divmod,
-                # Exceptions
-                'Exception': Exception,
-                'ValueError': ValueError,
-                'TypeError': TypeError,
-                'IndexError': IndexError,
-                'KeyError': KeyError,
-                'AttributeError': AttributeError,
-                'ZeroDivisionError': ZeroDivisionError,
-                # Common modules (need to be imported explicitly)
-            }
-        }
-        
-        exec_locals = {}
-        
-        # Execute the code
+        return marshal.dumps(compile_code(source))
+    except SyntaxError:
+        # Let the worker compile it again and report the error like any other
+        return None
+
+def _load_code(source: str, bytecode: bytes | None) -> CodeType | str:
+    """Rebuild a code object sent by the parent, falling back to the source"""
+    return marshal.loads(bytecode) if bytecode is not None else source
+
+def _run_code(code: CodeType | Callable[[], None], exec_globals: Dict[str, Any],
+              exec_locals: Dict[str, Any]):
+    if isinstance(code, CodeType):
         exec(code, exec_globals, exec_locals)
+    else:
+        code()
+
+def _execute(code: str | CodeType | Callable[[], None], exec_globals: Dict[str, Any],
+             exec_locals: Dict[str, Any], output_buffer: BoundedOutput,
+             limits: Dict[str, Any], memory: str | None = "rss") -> Dict[str, Any]:
+    """
+    Run source, a code object or a no-argument function and describe the outcome as a result dict
+    
+    memory picks how peak memory is measured, as described in _Measurement.
+    """
+    result = _new_result()
+    measurement = _Measurement(memory)
+    line_budget = _LineBudget(limits["line_budget"])
+    
+    try:
+        if isinstance(code, str):
+            code = compile_code(code)
         
-        result["success"] = True
-        result["output"] = output_buffer.getvalue()
+        # Per-execution deadline enforced by the shared watchdog thread
+        deadline = _ExecutionDeadline(limits["timeout"])
+        try:
+            with measurement, line_budget:
+                if _in_sandbox_worker and resource is not None:
+                    with _ResourceLimits(limits):
+                        # Execute the code
+                        _run_code(code, exec_globals, exec_locals)
+                else:
+                    _run_code(code, exec_globals, exec_locals)
+        finally:
+            deadline.disarm()
         
-    except TimeoutException:
-        result["error"] = "Code execution timed out. Make sure your code doesn't have infinite loops."
+        result["success"] = True
         
-    except SyntaxError as e:
-        result["error"] = f"Syntax Error: {str(e)}\nLine {e.lineno}: {e.text if e.text else 'N/A'}"
+    except Exception as e:
+        result["error"] = format_execution_error(e)
+        result["limit_exceeded"] = _limit_exceeded(e)
+    
+    output_buffer.flush()
+    result["output"] = output_buffer.getvalue() if result["success"] else ""
+    result["truncated"] = output_buffer.truncated
+    result["output_bytes"] = output_buffer.bytes_written
+    result["output_lines"] = output_buffer.lines_written
+    result["execution_time"] = measurement.wall_time
+    result["cpu_user"] = measurement.cpu_user
+    result["cpu_system"] = measurement.cpu_system
+    result["peak_memory"] = measurement.peak_memory
+    if line_budget.budget is not None:
+        result["lines_executed"] = line_budget.lines
+    return result
+
+def _new_namespace(limits: Dict[str, Any], on_output: Callable[[str], None] | None = None) -> tuple:
+    """
+    Create a fresh restricted execution environment
+    
+    print() writes straight to the returned buffer, so concurrent
+    executions never share the process-wide sys.stdout. Top-level code
+    runs with one namespace for globals and locals, as a module does, so
+    functions can see the names it imports and defines. Like a script,
+    it runs as __main__, which class statements record as __module__.
+    """
+    output_buffer = BoundedOutput(limits["max_output_bytes"], limits["output_limit_bytes"], on_output)
+    exec_globals = {
+        '__builtins__': _make_builtins(output_buffer, limits["allowed_modules"]),
+        '__name__': '__main__'
+    }
+    return exec_globals, exec_globals, output_buffer
+
+def _run_with_limits(code: str | CodeType, limits: Dict[str, Any],
+                     on_output: Callable[[str], None] | None = None) -> Dict[str, Any]:
+    exec_globals, exec_locals, output_buffer = _new_namespace(limits, on_output)
+    return _execute(code, exec_globals, exec_locals, output_buffer, limits)
+
+def run_in_sandbox(code: str, timeout: float = 5, **limits) -> Dict[str, Any]:
+    """
+    Execute Python code in the current thread with restricted built-ins
+    
+    This is what each pool worker runs for a job. It can also be called
+    directly from any thread when the pool is disabled; the timeout is
+    enforced by the shared watchdog rather than a process-wide alarm.
+    
+    Args:
+        code: Python code to execute
+        timeout: Maximum execution time in seconds
+        limits: Overrides for DEFAULT_LIMITS. Memory and CPU limits are
+            only enforced inside sandbox workers.
+    
+    Returns:
+        Dictionary with success status, output, and error information
+    """
+    return _run_with_limits(code, _make_limits(timeout, **limits))
+
+class _ForkedChild:
+    """
+    Runs func() in a forked child that sends back the result dict it produces
+    
+    The child sees a copy-on-write snapshot of this process, so whatever
+    func() does to the namespace is thrown away when it exits. After
+    collect(), exitcode is 0 if func() returned, or nonzero (negative for
+    a signal) if it raised or the child was killed.
+    """
+    
+    def __init__(self, func):
+        read_fd, write_fd = os.pipe()
+        self.exitcode = None
+        self.pid = os.fork()
         
-    except NameError as e:
-        result["error"] = f"Name Error: {str(e)}\nMake sure all variables and functions are defined."
+        if self.pid == 0:
+            # Child: run the job, send the pickled result, and exit without cleanup
+            global _fork_rss
+            status = 1
+            try:
+                os.close(read_fd)
+                if _in_sandbox_worker and resource is not None:
+                    # A forked child's high-water mark starts at its size at the fork
+                    _fork_rss = _max_rss()
+                payload = pickle.dumps(func())
+                with os.fdopen(write_fd, 'wb') as pipe:
+                    pipe.write(payload)
+                status = 0
+            finally:
+                os._exit(status)
         
-    except ZeroDivisionError as e:
-        result["error"] = f"Division by Zero Error: {str(e)}\nYou cannot divide by zero."
+        os.close(write_fd)
+        self.pipe = os.fdopen(read_fd, 'rb')
+    
+    def collect(self, timed_out: bool = False) -> Dict[str, Any]:
+        """Read the child's result (or kill it if it ran out of time) and reap it"""
+        if timed_out:
+            os.kill(self.pid, signal.SIGKILL)
+            payload = None
+        else:
+            payload = self.pipe.read()
+        self.pipe.close()
+        _, status = os.waitpid(self.pid, 0)
+        self.exitcode = os.waitstatus_to_exitcode(status)
         
-    except IndexError as e:
-        result["error"] = f"Index Error: {str(e)}\nYou're trying to access an index that doesn't exist."
+        if payload:
+            return pickle.loads(payload)
         
-    except KeyError as e:
-        result["error"] = f"Key Error: {str(e)}\nThe dictionary key you're looking for doesn't exist."
+        result = _new_result()
+        result["error"] = TIMEOUT_MESSAGE if timed_out else "Runtime Error: Test process exited unexpectedly"
+        return result
+
+def _iter_forked(jobs: list, timeout: float, max_parallel: int) -> Iterator[tuple]:
+    """
+    Run each job function in its own forked child, several at a time
+    
+    Yields:
+        (index, result) pairs in completion order
+    """
+    pending = deque(enumerate(jobs))
+    running = {}
+    
+    while pending or running:
+        while pending and len(running) < max_parallel:
+            index, func = pending.popleft()
+            child = _ForkedChild(func)
+            running[child.pipe] = (index, child, time.monotonic() + timeout + WORKER_GRACE_PERIOD)
         
-    except TypeError as e:
-        result["error"] = f"Type Error: {str(e)}\nCheck the data types you're working with."
+        next_deadline = min(deadline for _, _, deadline in running.values())
+        ready, _, _ = select.select(list(running), [], [], max(0, next_deadline - time.monotonic()))
         
-    except ValueError as e:
-        result["error"] = f"Value Error: {str(e)}\nThe value provided is not appropriate for the operation."
+        for pipe in ready:
+            index, child, _ = running.pop(pipe)
+            yield index, child.collect()
         
+        now = time.monotonic()
+        for pipe, (index, child, deadline) in list(running.items()):
+            if deadline <= now:
+                del running[pipe]
+                yield index, child.collect(timed_out=True)
+
+def _is_assertion_test(expected: str) -> bool:
+    """Assertion-based tests have no expected output and pass by running cleanly"""
+    return not expected or expected.lower() in ['', 'none', 'no output']
+
+def _test_detail(test_number: int, expected: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the per-test entry of a run_tests result"""
+    actual = result.get('output', '').strip()
+    assertion = _is_assertion_test(expected)
+    
+    return {
+        "test_number": test_number,
+        "passed": result['success'] and (assertion or actual == expected),
+        "assertion": assertion,
+        "expected": expected,
+        "actual": actual,
+        "error": result.get('error', ''),
+        "truncated": result.get('truncated', False),
+        "limit_exceeded": result.get('limit_exceeded'),
+        "execution_time": result.get('execution_time', 0),
+        "cpu_user": result.get('cpu_user', 0.0),
+        "cpu_system": result.get('cpu_system', 0.0),
+        "peak_memory": result.get('peak_memory'),
+        "output_bytes": result.get('output_bytes', 0),
+        "lines_executed": result.get('lines_executed')
+    }
+
+def _summarize_tests(program: Dict[str, Any], details: list) -> Dict[str, Any]:
+    details = sorted(details, key=lambda detail: detail['test_number'])
+    return {
+        "passed": sum(1 for detail in details if detail['passed']),
+        "total": len(details),
+        "details": details,
+        "program": program
+    }
+
+# Longest repr kept for the arguments, expected and actual value of a test vector
+VECTOR_REPR_LIMIT = 200
+
+# Filename for reference solutions, so their lines do not count against the line budget
+REFERENCE_FILENAME = "<reference>"
+
+# Sandbox limits stop the whole batch instead of failing a single vector
+_LIMIT_EXCEPTIONS = (
+    TimeoutException, CPULimitExceeded, OutputLimitExceeded, LineBudgetExceeded,
+    ExecutionCancelled, MemoryError
+)
+
+def is_batch_test(test_case: Dict[str, Any]) -> bool:
+    """
+    Batch tests call one function on many argument vectors in a single execution
+    
+    {"function": name, "args": [[...], ...], "returns": [...]} lists the
+    expected return values; {"function": name, "args": [...], "reference":
+    source} computes them with a reference solution defining the same function.
+    """
+    return 'function' in test_case
+
+def _short_repr(value: Any) -> str:
+    try:
+        text = repr(value)
     except Exception as e:
-        # Capture the full traceback for unexpected errors
-        tb_str = traceback.format_exc()
-        result["error"] = f"Runtime Error: {str(e)}\n\nFull traceback:\n{tb_str}"
+        text = f"<repr failed: {type(e).__name__}>"
+    return text if len(text) <= VECTOR_REPR_LIMIT else text[:VECTOR_REPR_LIMIT - 3] + '...'
+
+def _values_match(actual: Any, expected: Any) -> bool:
+    if isinstance(actual, float) or isinstance(expected, float):
+        try:
+            return math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-9)
+        except TypeError:
+            return False
+    if isinstance(actual, tuple) and isinstance(expected, list):
+        # Expected values written as JSON-style lists still match tuples
+        actual = list(actual)
+    return actual == expected
+
+def _run_batch_test(test_case: Dict[str, Any], exec_globals: Dict[str, Any],
+                    output_buffer: BoundedOutput, limits: Dict[str, Any]) -> Dict[str, Any]:
+    """Call the tested function on every argument vector as one execution"""
+    name = test_case['function']
+    vectors = []
+    
+    def run_vectors():
+        function = exec_globals.get(name)
+        if not callable(function):
+            raise NameError(f"name '{name}' is not defined")
         
-    finally:
-        # Restore original stdout and stderr
-        sys.stdout = original_stdout
-        sys.stderr = original_stderr
+        reference = None
+        if 'reference' in test_case:
+            reference_globals, _, _ = _new_namespace(limits)
+            exec(compile_code(test_case['reference'], REFERENCE_FILENAME), reference_globals)
+            reference = reference_globals[name]
+        returns = test_case.get('returns', [])
         
-        # Cancel the alarm (if set)
-        if hasattr(signal, 'SIGALRM'):
-            signal.alarm(0)
+        for i, args in enumerate(test_case.get('args', [])):
+            args = tuple(args) if isinstance(args, (list, tuple)) else (args,)
+            vector = {
+                "args": ', '.join(_short_repr(arg) for arg in args),
+                "expected": "",
+                "actual": "",
+                "passed": False,
+                "error": ""
+            }
+            try:
+                # Fresh copies keep a function that mutates its arguments
+                # from affecting the reference call or later vectors
+                expected = reference(*copy.deepcopy(args)) if reference else returns[i]
+                vector["expected"] = _short_repr(expected)
+                actual = function(*copy.deepcopy(args))
+                vector["actual"] = _short_repr(actual)
+                vector["passed"] = _values_match(actual, expected)
+            except _LIMIT_EXCEPTIONS:
+                raise
+            except Exception as e:
+                vector["error"] = f"{type(e).__name__}: {e}"
+            vectors.append(vector)
+    
+    result = _execute(run_vectors, exec_globals, exec_globals, output_buffer, limits)
+    result["vectors"] = vectors
+    return result
+
+# Defaults for the "budget" of a performance-graded test case
+PERF_WARMUP_RUNS = 1
+PERF_REPEAT_RUNS = 5
+
+# Timings this close to the reference always pass, so tiny tests are not
+# failed by timer noise
+PERF_TIME_SLACK = 0.002
+
+def is_budget_test(test_case: Dict[str, Any]) -> bool:
+    """
+    Performance-graded tests also time the test snippet against a reference solution
+    
+    "budget": {"time": 3, "memory": 2} allows 3x the reference's best wall
+    time and 2x its peak memory; "warmup" and "repeat" set how many
+    untimed and timed runs each side gets. The reference source goes in
+    "reference" (resolve_test_cases fills it in from the exercise example).
+    """
+    return 'budget' in test_case and not is_batch_test(test_case)
+
+def _performance_failure(result: Dict[str, Any], message: str) -> Dict[str, Any]:
+    result["success"] = False
+    result["output"] = ""
+    result["error"] = f"Performance Error: {message}"
+    return result
+
+def _run_budget_test(test_case: Dict[str, Any], test_code: str | CodeType,
+                     exec_globals: Dict[str, Any], exec_locals: Dict[str, Any],
+                     output_buffer: BoundedOutput, limits: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a test snippet, then time it against the reference solution
+    
+    The reference and the submission run in the same process, interleaved,
+    so both see the same machine load. All runs together stay within the
+    test's timeout.
+    """
+    deadline = time.monotonic() + limits["timeout"]
+    budget = test_case['budget']
+    
+    def run(code, namespace, buffer, memory=None):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        return _execute(code, namespace, namespace, buffer, dict(limits, timeout=remaining), memory)
+    
+    # Both sides run in this one process, whose RSS high-water mark only
+    # grows, so comparing their peak memory takes tracemalloc
+    compared_memory = "tracemalloc" if 'memory' in budget else None
+    result = run(test_code, exec_globals, output_buffer, compared_memory or "rss")
+    if result is None or not result['success']:
+        return result or _performance_failure(_new_result(), "Ran out of time before timing started.")
+    if 'reference' not in test_case:
+        return _performance_failure(result, "This test has no reference solution to compare against.")
+    
+    reference_globals, _, reference_buffer = _new_namespace(limits)
+    reference = run(compile_code(test_case['reference'], REFERENCE_FILENAME), reference_globals, reference_buffer,
+                    compared_memory)
+    baseline = reference and run(test_code, reference_globals, reference_buffer, compared_memory)
+    if not baseline or not baseline['success']:
+        return _performance_failure(result, "The reference solution failed this test.")
+    
+    # Untimed warm-up, then keep each side's best time like timeit does
+    times, reference_times = [], []
+    warmup = budget.get('warmup', PERF_WARMUP_RUNS)
+    for i in range(warmup + budget.get('repeat', PERF_REPEAT_RUNS)):
+        reference_run = run(test_code, reference_globals, reference_buffer)
+        user_run = reference_run and run(test_code, exec_globals, output_buffer)
+        if not user_run or not user_run['success']:
+            return _performance_failure(result, "Your solution ran out of time while being timed.")
+        if i >= warmup:
+            reference_times.append(reference_run['execution_time'])
+            times.append(user_run['execution_time'])
+    
+    performance = {
+        "time": min(times) if times else result['execution_time'],
+        "reference_time": min(reference_times) if reference_times else baseline['execution_time'],
+        "time_budget": None,
+        "memory": result['peak_memory'],
+        "reference_memory": baseline['peak_memory'],
+        "memory_budget": None
+    }
+    result["performance"] = performance
+    
+    if 'time' in budget:
+        performance["time_budget"] = max(budget['time'] * performance['reference_time'],
+                                         performance['reference_time'] + PERF_TIME_SLACK)
+        if performance['time'] > performance['time_budget']:
+            return _performance_failure(result, (
+                f"Your solution took {performance['time'] * 1000:.1f} ms, more than "
+                f"{budget['time']}x the reference solution ({performance['reference_time'] * 1000:.1f} ms). "
+                "Look for a more efficient approach."
+            ))
+    # Peak memory is only measured inside sandbox workers
+    if 'memory' in budget and performance['memory'] is not None and performance['reference_memory'] is not None:
+        performance["memory_budget"] = budget['memory'] * max(performance['reference_memory'], 1)
+        if performance['memory'] > performance['memory_budget']:
+            return _performance_failure(result, (
+                f"Your solution used {_format_bytes(performance['memory'])} of memory, more than "
+                f"{budget['memory']}x the reference solution ({_format_bytes(performance['reference_memory'])})."
+            ))
+    return result
+
+def _is_namespace_test(test_case: Dict[str, Any]) -> bool:
+    """Tests that need the program's namespace rather than a snippet appended to the source"""
+    return is_batch_test(test_case) or is_budget_test(test_case)
+
+def _run_test_case(test_case: Dict[str, Any], test_code: str | CodeType,
+                   exec_globals: Dict[str, Any], exec_locals: Dict[str, Any],
+                   output_buffer: BoundedOutput, limits: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one test case in the namespace the program left behind"""
+    if is_batch_test(test_case):
+        return _run_batch_test(test_case, exec_globals, output_buffer, limits)
+    if is_budget_test(test_case):
+        return _run_budget_test(test_case, test_code, exec_globals, exec_locals, output_buffer, limits)
+    return _execute(test_code, exec_globals, exec_locals, output_buffer, limits)
+
+def _test_case_detail(test_number: int, test_case: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the per-test entry for a snippet, batch or performance-graded test case"""
+    if not is_batch_test(test_case):
+        detail = _test_detail(test_number, test_case.get('expected', ''), result)
+        if is_budget_test(test_case):
+            detail["performance"] = result.get('performance')
+        return detail
+    
+    vectors = result.get('vectors', [])
+    total = len(test_case.get('args', []))
+    passed = sum(1 for vector in vectors if vector['passed'])
+    
+    detail = _test_detail(test_number, '', result)
+    detail["passed"] = result['success'] and passed == total
+    detail["assertion"] = False
+    detail["expected"] = f"{total} of {total} vectors passing"
+    detail["actual"] = f"{passed} of {total} vectors passing"
+    detail["vectors"] = vectors
+    return detail
+
+def iter_tests_in_sandbox(code: str, test_cases: list, limits: Dict[str, Any] | None = None,
+                          max_parallel: int | None = None,
+                          compiled: tuple | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Execute the user program once, then each test case against a snapshot of it
+    
+    Each test runs in a forked child holding a copy-on-write snapshot of
+    the namespace the program left behind, so tests cannot see each
+    other's side effects and the program itself is never re-executed.
+    Up to max_parallel tests run at once. Without fork() every test
+    re-runs the program with the test appended.
+    
+    Args:
+        code: User's Python code
+        test_cases: List of test case dictionaries
+        limits: Per-execution limits applied to the program and to each test
+        max_parallel: Tests to run at once (defaults to MAX_PARALLEL_TESTS)
+        compiled: Optional (program, [tests]) code objects already compiled
+            from code and the test snippets
+    
+    Yields:
+        Events as described in iter_test_results
+    """
+    limits = limits or _make_limits(5)
+    
+    if not hasattr(os, 'fork'):
+        yield from _iter_tests_sequential(code, test_cases, limits)
+        return
+    
+    if compiled is not None:
+        program_code, test_codes = compiled
+    else:
+        program_code = code
+        test_codes = [test_case.get('test', '') for test_case in test_cases]
+    
+    exec_globals, exec_locals, output_buffer = _new_namespace(limits)
+    program = _execute(program_code, exec_globals, exec_locals, output_buffer, limits)
+    yield {"type": "program", "result": program}
+    
+    if not program['success']:
+        # The concatenated program would have failed before reaching any test
+        for i, test_case in enumerate(test_cases):
+            yield {"type": "test", "detail": _test_case_detail(i + 1, test_case, program)}
+        return
+    
+    def make_job(test_case, test_code):
+        return lambda: _run_test_case(test_case, test_code, exec_globals, exec_locals, output_buffer, limits)
+    
+    jobs = [make_job(test_case, test_code) for test_case, test_code in zip(test_cases, test_codes)]
+    for index, result in _iter_forked(jobs, limits["timeout"], max_parallel or MAX_PARALLEL_TESTS):
+        yield {"type": "test", "detail": _test_case_detail(index + 1, test_cases[index], result)}
+
+def _iter_tests_sequential(code: str, test_cases: list, limits: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Run each test by re-executing the program with the test appended"""
+    yield {"type": "program", "result": _run_with_limits(code, limits)}
+    
+    for i, test_case in enumerate(test_cases):
+        if _is_namespace_test(test_case):
+            exec_globals, exec_locals, output_buffer = _new_namespace(limits)
+            result = _execute(code, exec_globals, exec_locals, output_buffer, limits)
+            if result['success']:
+                test_code = test_case.get('test', '')
+                result = _run_test_case(test_case, test_code, exec_globals, exec_locals, output_buffer, limits)
+        else:
+            test_code = code + "\n" + test_case.get('test', '')
+            result = _run_with_limits(test_code, limits)
+        yield {"type": "test", "detail": _test_case_detail(i + 1, test_case, result)}
+
+def _handle_job(job: Dict[str, Any], emit: Callable[[Any], None]) -> Dict[str, Any] | None:
+    """
+    Entry point each pool worker calls for a job
+    
+    The job runs in a forked child of the worker, so nothing it changes
+    (such as a method patched onto a sandbox module's class, which every
+    execution's module views share) outlives it. The child streams its
+    events through emit() itself. A tests job replies None, or
+    {"exitcode": ...} if its child died before reporting every test.
+    """
+    _init_sandbox_worker()
+    
+    program = _load_code(job["code"], job.get("bytecode"))
+    
+    if job.get("kind") == "tests":
+        tests = [
+            _load_code(test_case.get('test', ''), bytecode)
+            for test_case, bytecode in zip(job["test_cases"], job["test_bytecode"])
+        ]
+        events = iter_tests_in_sandbox(
+            job["code"], job["test_cases"], job["limits"],
+            max_parallel=job.get("max_parallel"), compiled=(program, tests)
+        )
+        if not hasattr(os, 'fork'):
+            return events
+        
+        def run_tests_job():
+            for event in events:
+                emit(event)
         
-        # If there were any stderr messages, add them to the error
-        stderr_content = error_buffer.getvalue()
-        if stderr_content and not result["error"]:
-            result["error"] = stderr_content
-            result["success"] = False
+        child = _ForkedChild(run_tests_job)
+        child.collect()
+        return {"exitcode": child.exitcode} if child.exitcode else None
     
+    on_output = None
+    if job.get("stream_output"):
+        on_output = lambda text: emit({"type": "output", "text": text})
+    if not hasattr(os, 'fork'):
+        return _run_with_limits(program, job["limits"], on_output)
+    
+    child = _ForkedChild(lambda: _run_with_limits(program, job["limits"], on_output))
+    result = child.collect()
+    return _worker_failure_result(WorkerCrashed(child.exitcode)) if child.exitcode else result
+
+def _worker_failure_result(e: Exception) -> Dict[str, Any]:
+    """Describe a job that was turned away, cancelled, timed out or crashed as a result dict"""
+    result = _new_result()
+    if isinstance(e, SchedulerBusy):
+        result["error"] = f"Server Busy: {str(e)}. Please try again in a moment."
+        result["limit_exceeded"] = "busy"
+    elif isinstance(e, ExecutionCancelled):
+        result["error"] = format_execution_error(e)
+        result["limit_exceeded"] = "cancelled"
+    elif isinstance(e, WorkerTimeout):
+        result["error"] = TIMEOUT_MESSAGE
+        result["limit_exceeded"] = "timeout"
+    elif hasattr(signal, 'SIGXCPU') and e.exitcode == -signal.SIGXCPU:
+        result["error"] = format_execution_error(CPULimitExceeded())
+        result["limit_exceeded"] = "cpu"
+    else:
+        result["error"] = f"Runtime Error: {str(e)}"
     return result
 
+def configure_pool(workers: int | None = None):
+    """
+    Set the number of sandbox worker processes
+    
+    Args:
+        workers: Number of workers, None for one per core, or 0 to run
+            code in the server process instead of a pool
+    """
+    global _pool, _pool_workers, _scheduler
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+        _pool_workers = workers
+        _scheduler = None
+
+def get_pool() -> SandboxPool | None:
+    """Return the shared sandbox pool, starting it on first use"""
+    global _pool
+    if _pool_workers == 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                _handle_job,
+                workers=_pool_workers,
+                warmup_job={"code": "pass", "limits": _make_limits(1)},
+                max_tasks=WORKER_MAX_TASKS,
+                max_rss_growth_mb=WORKER_MAX_RSS_GROWTH_MB
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def get_pool_health() -> Dict[str, Any] | None:
+    """
+    Return worker pool health for dashboards
+    
+    Returns:
+        Busy/idle worker counts, tasks run, workers recycled (task or
+        memory limit) and replaced (timeout or crash), mean task latency
+        in seconds and per-worker task counts and memory growth, or None
+        when code runs in the server process
+    """
+    pool = get_pool()
+    return pool.health() if pool is not None else None
+
+def get_scheduler() -> ExecutionScheduler:
+    """Return the shared execution scheduler, sized to the sandbox pool"""
+    global _scheduler
+    pool = get_pool()
+    with _pool_lock:
+        if _scheduler is None:
+            capacity = pool.size if pool is not None else (os.cpu_count() or 1)
+            _scheduler = ExecutionScheduler(capacity)
+        return _scheduler
+
+def get_scheduler_stats() -> Dict[str, Any]:
+    """Return running count, queue depth and wait times for each priority lane"""
+    return get_scheduler().stats()
+
+def execute_code(code: str, timeout: float = 5, priority: str = "interactive",
+                 session_id: str | None = None, cancel_token: CancelToken | None = None,
+                 on_output: Callable[[str], None] | None = None, **limits) -> Dict[str, Any]:
+    """
+    Safely execute Python code and return the result
+    
+    The code runs on a pre-forked worker process so a slow submission
+    cannot stall other sessions on the server. Compiled code objects are
+    cached by content hash, so resubmitting the same source skips compilation.
+    
+    Args:
+        code: Python code to execute
+        timeout: Maximum execution time in seconds
+        priority: Scheduler lane, "interactive", "submit" or "batch"
+        session_id: Caller's session, used to cap concurrent runs per user
+        cancel_token: Token whose cancellation stops the run (see start_execution)
+        on_output: Called with chunks of output while the code runs; only the
+            first max_output_bytes are streamed
+        limits: Overrides for DEFAULT_LIMITS (output, memory and CPU caps).
+            Output beyond max_output_bytes is counted in "output_bytes" and
+            "output_lines" and sets "truncated"; hitting any limit stops the
+            program and names it in "limit_exceeded".
+    
+    Returns:
+        Dictionary with success status, output, and error information
+    """
+    limits = _make_limits(timeout, **limits)
+    
+    safety = validate_code_safety(code)
+    if not safety["is_safe"]:
+        return _unsafe_result(safety)
+    
+    try:
+        with get_scheduler().slot(priority, session_id, cancel_token):
+            pool = get_pool()
+            if pool is None:
+                with _CancelInterrupt(cancel_token):
+                    return _run_with_limits(code, limits, on_output)
+            
+            job = {
+                "code": code,
+                "bytecode": _marshal_code(code),
+                "limits": limits,
+                "stream_output": on_output is not None
+            }
+            messages = pool.stream(job, timeout + WORKER_GRACE_PERIOD, cancel_token)
+            while True:
+                try:
+                    message = next(messages)
+                except StopIteration as stop:
+                    return stop.value
+                on_output(message["text"])
+    except (WorkerTimeout, WorkerCrashed, SchedulerBusy, ExecutionCancelled) as e:
+        return _worker_failure_result(e)
+
+# How validate_code_safety() treats each construct: "block" marks the code
+# unsafe so it is not run, "warn" only reports it
+SAFETY_POLICY = {
+    # Modules imported with import / from ... import
+    "import": {
+        'os': 'warn',
+        'sys': 'warn',
+        'subprocess': 'warn',
+        'socket': 'warn',
+        'urllib': 'warn',
+        'requests': 'warn',
+        'http': 'warn',
+    },
+    # Built-in names, whether called or just referenced; a name the code
+    # binds itself (for file in ..., def compile(): ...) is its own
+    "name": {
+        'exec': 'block',
+        'eval': 'block',
+        'compile': 'block',
+        '__import__': 'block',
+        '__builtins__': 'block',
+        'open': 'block',
+        'breakpoint': 'block',
+        'globals': 'warn',
+        'locals': 'warn',
+        'vars': 'warn',
+        'dir': 'warn',
+        'getattr': 'warn',
+        'setattr': 'warn',
+        'delattr': 'warn',
+        'hasattr': 'warn',
+    },
+    # Attributes that lead from ordinary objects back to frames, globals or
+    # every loaded class; also matched as string constants (getattr(x, "..."))
+    "attribute": {
+        '__subclasses__': 'block',
+        '__globals__': 'block',
+        '__builtins__': 'block',
+        '__code__': 'block',
+        '__closure__': 'block',
+        '__bases__': 'block',
+        '__base__': 'block',
+        '__mro__': 'block',
+        'f_globals': 'block',
+        'f_locals': 'block',
+        'f_builtins': 'block',
+        'f_back': 'block',
+        'gi_frame': 'block',
+        'cr_frame': 'block',
+        'ag_frame': 'block',
+        'tb_frame': 'block',
+        '__dict__': 'warn',
+        '__getattribute__': 'block',
+    },
+    # Built-ins called with an attribute name that is not a string literal,
+    # which the "attribute" section cannot see
+    "computed_attribute": {
+        'getattr': 'block',
+        'setattr': 'block',
+        'delattr': 'block',
+        'hasattr': 'block',
+    },
+}
+
+# Safety verdicts keyed by a hash of the source
+_safety_cache = LRUCache(maxsize=1024)
+
+class _SafetyVisitor(ast.NodeVisitor):
+    """Classifies imports, names and attribute access against SAFETY_POLICY in one pass
+    
+    Names are only reported once the whole module has been seen, and only
+    if nothing in it binds them; call finish() after visiting.
+    """
+    
+    def __init__(self):
+        self.warnings = []
+        self.violations = []
+        # (action, pattern, line, name it is about or None) in visiting order
+        self._reports = []
+        self._bound = set()
+    
+    def _report(self, action: str | None, pattern: str, node: ast.AST, name: str | None = None):
+        if action is not None:
+            self._reports.append((action, pattern, node.lineno, name))
+    
+    def finish(self):
+        """Turn the reports into warnings and violations, dropping names the code binds"""
+        for action, pattern, line, name in self._reports:
+            if name is not None and name in self._bound:
+                continue
+            message = f"Potentially unsafe pattern detected: {pattern} (line {line})"
+            self.warnings.append(message)
+            if action == 'block':
+                self.violations.append(message)
+    
+    def _check_import(self, module: str, node: ast.AST):
+        top_level = module.partition('.')[0]
+        self._report(SAFETY_POLICY["import"].get(top_level), f"import {module}", node)
+    
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self._bound.add(alias.asname or alias.name.partition('.')[0])
+            self._check_import(alias.name, node)
+    
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        self._bound.update(alias.asname or alias.name for alias in node.names)
+        if node.module:
+            self._check_import(node.module, node)
+    
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self._report(SAFETY_POLICY["name"].get(node.id), node.id, node, node.id)
+        else:
+            self._bound.add(node.id)
+    
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self._bound.add(node.name)
+        self.generic_visit(node)
+    
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_ClassDef = visit_FunctionDef
+    
+    def visit_arg(self, node: ast.arg):
+        self._bound.add(node.arg)
+        self.generic_visit(node)
+    
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):
+        if node.name:
+            self._bound.add(node.name)
+        self.generic_visit(node)
+    
+    def visit_MatchAs(self, node):
+        if node.name:
+            self._bound.add(node.name)
+        self.generic_visit(node)
+    
+    def visit_MatchStar(self, node):
+        if node.name:
+            self._bound.add(node.name)
+    
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self._bound.add(node.rest)
+        self.generic_visit(node)
+    
+    def visit_Call(self, node: ast.Call):
+        if isinstance(node.func, ast.Name) and len(node.args) >= 2:
+            name_arg = node.args[1]
+            if not (isinstance(name_arg, ast.Constant) and isinstance(name_arg.value, str)):
+                action = SAFETY_POLICY["computed_attribute"].get(node.func.id)
+                self._report(action, f"{node.func.id}() with a computed attribute name", node, node.func.id)
+        self.generic_visit(node)
+    
+    def visit_Attribute(self, node: ast.Attribute):
+        self._report(SAFETY_POLICY["attribute"].get(node.attr), f".{node.attr}", node)
+        self.generic_visit(node)
+    
+    def visit_Constant(self, node: ast.Constant):
+        if isinstance(node.value, str):
+            self._report(SAFETY_POLICY["attribute"].get(node.value), repr(node.value), node)
+
 def validate_code_safety(code: str) -> Dict[str, Any]:
     """
     Validate that the code doesn't contain potentially dangerous operations
     
+    The code is parsed once and its imports, names and attribute access
+    are checked against SAFETY_POLICY, so text inside strings and
+    comments is not mistaken for code. Results are cached by content hash.
+    
     Args:
         code: Python code to validate
     
     Returns:
-        Dictionary with validation status and warnings
-    """
-    
-    dangerous_patterns = [
-        'import os',
-        'import sys',
-        'import subprocess',
-        'import socket',
-        'import urllib',
-        'import requests',
-        'import http',
-        'open(',
-        'file(',
-        'exec(',
-        'eval(',
-        '__import__',
-        'globals()',
-        'locals()',
-        'vars()',
-        'dir()',
-        'getattr(',
-        'setattr(',
-        'delattr(',
-        'hasattr(',
+        Dictionary with validation status, warnings, and the warnings
+        that made the code unsafe under "violations"
+    """
+    def check():
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            # Compiling the code reports the syntax error itself
+            return {"is_safe": True, "warnings": [], "violations": []}
+        
+        visitor = _SafetyVisitor()
+        visitor.visit(tree)
+        visitor.finish()
+        return {
+            "is_safe": not visitor.violations,
+            "warnings": visitor.warnings,
+            "violations": visitor.violations
+        }
+    
+    verdict = _safety_cache.get_or_compute(content_hash(code), check)
+    return copy.deepcopy(verdict)
+
+def _unsafe_result(safety: Dict[str, Any]) -> Dict[str, Any]:
+    """Describe code refused by validate_code_safety() as a result dict"""
+    result = _new_result()
+    result["error"] = (
+        "Security Error: Your code uses features that are not available in the practice sandbox.\n"
+        + "\n".join(safety["violations"])
+    )
+    result["limit_exceeded"] = "unsafe"
+    return result
+
+def normalized_ast_hash(code: str) -> str | None:
+    """
+    Hash the structure of code, ignoring comments, whitespace and line numbers
+    
+    Returns:
+        Hex digest, or None if the code does not parse
+    """
+    tree = _parse_or_none(code)
+    if tree is None:
+        return None
+    return content_hash(ast.dump(tree, annotate_fields=False, include_attributes=False))
+
+def _parse_or_none(code: str) -> ast.Module | None:
+    try:
+        return ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+def _imports_nondeterministic(tree: ast.Module | None) -> bool:
+    """Whether parsed code imports a module whose results vary from run to run"""
+    for node in ast.walk(tree) if tree is not None else ():
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            names = [node.module or '']
+        else:
+            continue
+        if any(name.split('.')[0] in NONDETERMINISTIC_MODULES for name in names):
+            return True
+    return False
+
+def _grading_key(code: str, test_cases: list, limits: Dict[str, Any]) -> tuple | None:
+    """Cache key for a grading run, or None if the submission cannot be cached"""
+    tree = _parse_or_none(code)
+    if tree is None:
+        return None
+    # Code drawing on random numbers or the clock can pass once and fail
+    # the next time, so its verdict is never replayed
+    snippets = [
+        test_case[field] for test_case in test_cases for field in ('test', 'reference')
+        if isinstance(test_case.get(field), str)
     ]
+    trees = [tree] + [_parse_or_none(snippet) for snippet in snippets]
+    if any(_imports_nondeterministic(source_tree) for source_tree in trees):
+        return None
+    code_hash = content_hash(ast.dump(tree, annotate_fields=False, include_attributes=False))
+    tests_hash = content_hash(json.dumps(test_cases, sort_keys=True, default=str))
+    # The sandbox profile: anything besides code and tests that affects the verdict
+    profile = tuple(sorted(limits.items()))
+    return code_hash, tests_hash, profile
+
+def _is_cacheable(program: Dict[str, Any], details: list) -> bool:
+    """
+    Timeouts, crashes and performance-graded tests depend on server load,
+    and tracebacks carry line numbers that a reformatted submission would
+    change, so results with any of them are never replayed from the cache
+    """
+    for result in [program] + details:
+        error = result.get('error', '')
+        if error and (error == TIMEOUT_MESSAGE or 'Traceback' in error or 'exited unexpectedly' in error):
+            return False
+        if result.get('performance') is not None or error.startswith('Performance Error:'):
+            return False
+        if result.get('limit_exceeded') in ('busy', 'cancelled'):
+            return False
+    return True
+
+def get_grading_cache_stats() -> Dict[str, Any]:
+    """Return size and hit/miss counters of the grading result cache"""
+    return _grading_cache.stats()
+
+def iter_test_results(code: str, test_cases: list, timeout: float = 5,
+                      priority: str = "submit", session_id: str | None = None,
+                      cancel_token: CancelToken | None = None, use_cache: bool = True,
+                      **limits) -> Iterator[Dict[str, Any]]:
+    """
+    Run test cases against the provided code, yielding results as they complete
     
-    warnings = []
-    is_safe = True
+    The program runs once on a sandbox worker, which then evaluates the
+    test cases concurrently against snapshots of the resulting namespace.
+    Iterate to the end: the worker is held until the last event, and
+    abandoning the iterator early kills and replaces it.
     
-    for pattern in dangerous_patterns:
-        if pattern in code.lower():
-            warnings.append(f"Potentially unsafe pattern detected: {pattern}")
-            if pattern in ['exec(', 'eval(', '__import__', 'open(', 'file(']:
-                is_safe = False
+    Results are cached by the normalized AST of the code, so resubmitting
+    code that differs only in comments or formatting replays the earlier
+    verdict without touching the sandbox.
     
-    return {
-        "is_safe": is_safe,
-        "warnings": warnings
+    Args:
+        code: User's Python code
+        test_cases: List of test case dictionaries
+        timeout: Maximum execution time in seconds for the program and for each test
+        priority: Scheduler lane, "interactive", "submit" or "batch"
+        session_id: Caller's session, used to cap concurrent runs per user
+        cancel_token: Token whose cancellation stops the run (see start_tests)
+        use_cache: Whether to replay and store verdicts in the grading cache
+        limits: Overrides for DEFAULT_LIMITS applied to the program and to each test
+    
+    Yields:
+        {"type": "program", "result": ...} with the result of running the
+        program on its own, then one {"type": "test", "detail": ...} per
+        test case in completion order; both have "cached": True when
+        replayed from the cache
+    """
+    limits = _make_limits(timeout, **limits)
+    
+    safety = validate_code_safety(code)
+    if not safety["is_safe"]:
+        yield from _failed_events(test_cases, _unsafe_result(safety))
+        return
+    
+    key = _grading_key(code, test_cases, limits) if use_cache else None
+    cached = _grading_cache.get(key) if key is not None else None
+    if cached is not None:
+        program, details = copy.deepcopy(cached)
+        # The timings are those of the run that was cached
+        program["cached"] = True
+        yield {"type": "program", "result": program}
+        for detail in details:
+            detail["cached"] = True
+            yield {"type": "test", "detail": detail}
+        return
+    
+    program = None
+    details = []
+    try:
+        with get_scheduler().slot(priority, session_id, cancel_token):
+            for event in _iter_test_results_uncached(code, test_cases, limits, cancel_token):
+                if event['type'] == 'program':
+                    program = event['result']
+                else:
+                    details.append(event['detail'])
+                yield copy.deepcopy(event)
+    except (SchedulerBusy, ExecutionCancelled) as e:
+        # Turned away or cancelled before anything ran
+        yield from _failed_events(test_cases, _worker_failure_result(e))
+        return
+    
+    if key is not None and _is_cacheable(program, details):
+        _grading_cache.put(key, (program, details))
+
+def _failed_events(test_cases: list, result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Events reporting the same failure for the program and every test case"""
+    yield {"type": "program", "result": result}
+    for i, test_case in enumerate(test_cases):
+        yield {"type": "test", "detail": _test_case_detail(i + 1, test_case, result)}
+
+def _iter_test_events(code: str, test_cases: list, limits: Dict[str, Any],
+                      cancel_token: CancelToken | None) -> Iterator[Dict[str, Any]]:
+    pool = get_pool()
+    if pool is None:
+        with _CancelInterrupt(cancel_token):
+            for event in _iter_tests_sequential(code, test_cases, limits):
+                yield event
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise ExecutionCancelled()
+        return
+    
+    job = {
+        "kind": "tests",
+        "code": code,
+        "bytecode": _marshal_code(code),
+        "test_cases": test_cases,
+        "test_bytecode": [_marshal_code(test_case.get('test', '')) for test_case in test_cases],
+        "limits": limits,
+        "max_parallel": _test_fan_out()
     }
+    timeout = limits["timeout"] * (len(test_cases) + 1) + WORKER_GRACE_PERIOD
+    reply = yield from pool.stream(job, timeout, cancel_token)
+    if reply is not None:
+        # The worker's child running the tests died; report the rest as crashed
+        raise WorkerCrashed(reply["exitcode"])
+
+def _test_fan_out() -> int:
+    """Test children a tests job may run at once: one, plus any pool slots nobody is using"""
+    stats = get_scheduler().stats()
+    idle = stats["capacity"] - stats["running"]
+    return max(1, min(MAX_PARALLEL_TESTS, idle + 1))
+
+def _iter_test_results_uncached(code: str, test_cases: list, limits: Dict[str, Any],
+                                cancel_token: CancelToken | None = None) -> Iterator[Dict[str, Any]]:
+    seen_program = False
+    reported = set()
+    try:
+        for event in _iter_test_events(code, test_cases, limits, cancel_token):
+            if event['type'] == 'program':
+                seen_program = True
+            else:
+                reported.add(event['detail']['test_number'])
+            yield event
+    except (WorkerTimeout, WorkerCrashed, ExecutionCancelled) as e:
+        result = _worker_failure_result(e)
+        if not seen_program:
+            yield {"type": "program", "result": result}
+        for i, test_case in enumerate(test_cases):
+            if i + 1 not in reported:
+                yield {"type": "test", "detail": _test_case_detail(i + 1, test_case, result)}
 
-def run_tests(code: str, test_cases: list) -> Dict[str, Any]:
+def run_tests(code: str, test_cases: list, timeout: float = 5, priority: str = "submit",
+              session_id: str | None = None, use_cache: bool = True, **limits) -> Dict[str, Any]:
     """
     Run test cases against the provided code
     
     Args:
         code: User's Python code
         test_cases: List of test case dictionaries
+        timeout: Maximum execution time in seconds for the program and for each test
+        priority: Scheduler lane, "interactive", "submit" or "batch"
+        session_id: Caller's session, used to cap concurrent runs per user
+        use_cache: Whether to replay and store verdicts in the grading cache
+        limits: Overrides for DEFAULT_LIMITS applied to the program and to each test
     
     Returns:
-        Dictionary with test results
+        Dictionary with test results, plus the result of running the
+        program on its own under "program"
     """
+    program = None
+    details = []
+    for event in iter_test_results(code, test_cases, timeout, priority, session_id,
+                                   use_cache=use_cache, **limits):
+        if event['type'] == 'program':
+            program = event['result']
+        else:
+            details.append(event['detail'])
     
-    results = {
-        "passed": 0,
-        "total": len(test_cases),
-        "details": []
-    }
+    return _summarize_tests(program, details)
+
+# Marks the end of an ExecutionHandle's event stream
+_END_OF_EVENTS = object()
+
+class ExecutionHandle:
+    """
+    An execution running on a background thread that can be cancelled
     
-    for i, test_case in enumerate(test_cases):
-        test_code = code + "\n" + test_case.get('test', '')
-        expected = test_case.get('expected', '')
-        
-        result = execute_code(test_code)
-        
-        test_result = {
-            "test_number": i + 1,
-            "passed": False,
-            "expected": expected,
-            "actual": result.get('output', '').strip(),
-            "error": result.get('error', '')
-        }
+    Cancelling kills the sandbox worker running the code (or withdraws the
+    request from the scheduler queue), so abandoned work stops using the
+    pool at once.
+    """
+    
+    def __init__(self, run: Callable[[CancelToken, Callable[[Any], None]], None]):
+        """
+        Args:
+            run: Called on the background thread as run(cancel_token, emit);
+                each event passed to emit() is delivered by iter_events()
+        """
+        self._cancel_token = CancelToken()
+        self._events = queue.Queue()
+        self._done = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._pump, args=(run,), name="execution-handle", daemon=True
+        )
+        self._thread.start()
+    
+    def _pump(self, run: Callable[[CancelToken, Callable[[Any], None]], None]):
+        try:
+            run(self._cancel_token, self._events.put)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+            self._events.put(_END_OF_EVENTS)
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_token.cancelled
+    
+    def done(self) -> bool:
+        """Return True once the execution has finished or been cancelled"""
+        return self._done.is_set()
+    
+    def cancel(self) -> bool:
+        """
+        Stop the execution
         
-        if result['success'] and result['output'].strip() == expected:
-            test_result['passed'] = True
-            results['passed'] += 1
+        Returns:
+            True if it was still running and is now being stopped
+        """
+        if self._done.is_set():
+            return False
+        return self._cancel_token.cancel()
+    
+    def iter_events(self, poll_interval: float = 0.1) -> Iterator[Any]:
+        """
+        Yield events as they arrive
         
-        results['details'].append(test_result)
+        None is yielded every poll_interval seconds while waiting, so a
+        caller can stay responsive (for example to a Stop button).
+        """
+        while True:
+            try:
+                event = self._events.get(timeout=poll_interval)
+            except queue.Empty:
+                yield None
+                continue
+            if event is _END_OF_EVENTS:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield event
+
+def start_execution(code: str, timeout: float = 5, priority: str = "interactive",
+                    session_id: str | None = None, **limits) -> ExecutionHandle:
+    """
+    Start execute_code() in the background, streaming its output
+    
+    Returns:
+        Handle whose iter_events() yields {"type": "output", "text": ...}
+        for each chunk of output as it is printed, then
+        {"type": "result", "result": ...} with the full result dictionary
+    """
+    def run(cancel_token, emit):
+        result = execute_code(
+            code, timeout, priority, session_id, cancel_token=cancel_token,
+            on_output=lambda text: emit({"type": "output", "text": text}), **limits
+        )
+        emit({"type": "result", "result": result})
+    
+    return ExecutionHandle(run)
+
+def start_tests(code: str, test_cases: list, timeout: float = 5, priority: str = "submit",
+                session_id: str | None = None, **limits) -> ExecutionHandle:
+    """
+    Start iter_test_results() in the background
+    
+    Returns:
+        Handle whose iter_events() yields the same events as iter_test_results()
+    """
+    def run(cancel_token, emit):
+        for event in iter_test_results(code, test_cases, timeout, priority, session_id,
+                                       cancel_token=cancel_token, **limits):
+            emit(event)
+    
+    return ExecutionHandle(run)
+
+def _format_bytes(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+def format_execution_stats(result: Dict[str, Any]) -> str:
+    """
+    Format the timing and memory figures of an execution result for display
     
-    return results
+    Args:
+        result: Result from execute_code, or a test detail from run_tests
+    
+    Returns:
+        One-line summary such as "12.3 ms wall · 11.9 ms CPU · 1.2 KB peak memory · 14 B output"
+    """
+    cpu_time = result.get('cpu_user', 0.0) + result.get('cpu_system', 0.0)
+    parts = [
+        f"{result.get('execution_time', 0) * 1000:.1f} ms wall",
+        f"{cpu_time * 1000:.1f} ms CPU"
+    ]
+    if result.get('peak_memory') is not None:
+        parts.append(f"{_format_bytes(result['peak_memory'])} peak memory")
+    parts.append(f"{_format_bytes(result.get('output_bytes', 0))} output")
+    if result.get('lines_executed') is not None:
+        parts.append(f"{result['lines_executed']} lines executed")
+    if result.get('cached'):
+        parts.append("cached from an earlier run")
+    return " · ".join(parts)
+
+def format_performance(performance: Dict[str, Any]) -> str:
+    """
+    Format how a performance-graded test compared with the reference solution
+    
+    Args:
+        performance: The "performance" entry of a test detail from run_tests
+    
+    Returns:
+        One-line summary such as "1.2 ms best time (reference 1.0 ms, budget 10.0 ms)"
+    """
+    timing = f"{performance['time'] * 1000:.1f} ms best time (reference {performance['reference_time'] * 1000:.1f} ms"
+    if performance.get('time_budget'):
+        timing += f", budget {performance['time_budget'] * 1000:.1f} ms"
+    parts = [timing + ")"]
+    if performance.get('memory') is not None and performance.get('reference_memory') is not None:
+        memory = f"{_format_bytes(performance['memory'])} peak memory (reference {_format_bytes(performance['reference_memory'])}"
+        if performance.get('memory_budget'):
+            memory += f", budget {_format_bytes(int(performance['memory_budget']))}"
+        parts.append(memory + ")")
+    return " · ".join(parts)
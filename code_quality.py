@@ -4,15 +4,103 @@ Code quality analysis and best practices suggestions for the Python practice pla
 
 import ast
 import re
-from typing import List, Dict, Any
+import copy
+from typing import List, Dict, Any, Tuple, Optional, Iterable
+
+from caching import LRUCache, content_hash
+from quality_rules import AnalysisContext, resolve_rules, run_rules
+
+# Patterns used to split code into blocks, compiled once
+TRIPLE_QUOTE_PATTERN = re.compile(r'"""|\'\'\'')
+FIRST_WORD_PATTERN = re.compile(r'\w*')
+
+# Line numbers inside messages; editor annotations carry the row instead
+LINE_PREFIX_PATTERN = re.compile(r'^Line \d+: ')
+SYNTAX_LOCATION_PATTERN = re.compile(r' \(<unknown>, line \d+\)$')
+
+# Unindented lines that continue the statement above rather than start a new block
+CONTINUATION_KEYWORDS = {'elif', 'else', 'except', 'finally'}
+CLOSING_BRACKETS = (')', ']', '}')
+
+# Blocks tried together when a block does not parse on its own, in case
+# the split landed inside a multi-line statement
+MAX_MERGED_BLOCKS = 4
+
+# Analyzed blocks kept per analyzer for incremental analysis
+BLOCK_CACHE_SIZE = 2048
+
+# Bump whenever a check changes what it reports, so cached analyses are not reused
+RULESET_VERSION = 2
+
+# Analysis results shared by every session, keyed by a hash of the exact
+# source (line checks depend on formatting), the rule set version and the
+# rules enabled
+_analysis_cache = LRUCache(maxsize=1024, ttl=3600)
+
+# st_ace annotation type for each kind of feedback
+ANNOTATION_TYPES = {
+    "warnings": "error",
+    "suggestions": "warning",
+    "best_practices": "info"
+}
+
+def split_blocks(code: str) -> List[Tuple[int, int]]:
+    """
+    Split code into top-level statement blocks
+    
+    A block starts at each unindented line, except comments, closing
+    brackets, else/elif/except/finally and lines inside a triple-quoted
+    string or after a decorator or backslash.
+    
+    Args:
+        code: Python code string
+        
+    Returns:
+        (first line, last line + 1) index pairs covering every line
+    """
+    lines = code.split('\n')
+    starts = [0]
+    in_string = False
+    continued = False
+    
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if (index and stripped and not in_string and not continued and not line[0].isspace()
+                and not stripped.startswith('#') and not stripped.startswith(CLOSING_BRACKETS)
+                and FIRST_WORD_PATTERN.match(stripped).group() not in CONTINUATION_KEYWORDS):
+            starts.append(index)
+        
+        if len(TRIPLE_QUOTE_PATTERN.findall(line)) % 2:
+            in_string = not in_string
+        if stripped:
+            continued = stripped.endswith('\\') or (stripped.startswith('@') and not in_string)
+    
+    return list(zip(starts, starts[1:] + [len(lines)]))
 
 class CodeQualityAnalyzer:
-    """Analyzes Python code and provides quality feedback and best practices suggestions"""
+    """Analyzes Python code and provides quality feedback and best practices suggestions
     
-    def __init__(self):
+    The code is parsed and split into lines once; every enabled rule from
+    quality_rules then runs over that shared context, and the per-function
+    complexity metrics come from the same parse.
+    
+    analyze_incremental() serves live editor feedback: it analyzes each
+    top-level block on its own and caches the result by the block's
+    source, so an edit only re-analyzes the block it touched.
+    """
+    
+    def __init__(self, rules: Optional[Iterable[str]] = None):
+        """
+        Args:
+            rules: Names of the rules to run (see resolve_rules); None runs
+                every rule currently enabled
+        """
+        self.rules = tuple(rules) if rules is not None else None
         self.suggestions = []
         self.warnings = []
         self.best_practices = []
+        self.metrics = None
+        self._block_cache = LRUCache(maxsize=BLOCK_CACHE_SIZE)
     
     def analyze_code(self, code: str) -> Dict[str, Any]:
         """
@@ -22,244 +110,103 @@ class CodeQualityAnalyzer:
             code: Python code string to analyze
             
         Returns:
-            Dictionary with analysis results
+            Dictionary with analysis results; "metrics" holds the
+            complexity_metrics.compute_metrics result, or None if the code
+            does not parse
         """
-        self.suggestions = []
-        self.warnings = []
-        self.best_practices = []
-        
-        # Basic syntax and structure checks
-        self._check_syntax(code)
-        self._check_naming_conventions(code)
-        self._check_code_style(code)
-        self._check_best_practices(code)
-        self._check_complexity(code)
+        context, warnings = self._parse(code)
+        findings = run_rules(context, self._active_rules())
+        self.warnings = [message for _, message in warnings]
+        self.suggestions = [message for _, message in findings["suggestions"]]
+        self.best_practices = [message for _, message in findings["best_practices"]]
+        self.metrics = context.metrics
         
         return {
             "suggestions": self.suggestions,
             "warnings": self.warnings,
             "best_practices": self.best_practices,
-            "score": self._calculate_quality_score()
+            "score": self._calculate_quality_score(),
+            "metrics": self.metrics
         }
     
-    def _check_syntax(self, code: str):
-        """Check for basic syntax issues"""
-        try:
-            ast.parse(code)
-        except SyntaxError as e:
-            self.warnings.append(f"Syntax Error: {str(e)}")
-            return
+    def analyze_incremental(self, code: str) -> List[Dict[str, Any]]:
+        """
+        Analyze code as editor annotations, re-analyzing only changed blocks
         
-        # Check for missing return statements in functions
-        if 'def ' in code and 'return' not in code:
-            # Parse to check if function should return something
-            try:
-                tree = ast.parse(code)
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.FunctionDef):
-                        # Check if function has computations that might need to be returned
-                        # Only suggest if the last statement is an expression or assignment
-                        if node.body:
-                            last_stmt = node.body[-1]
-                            if (isinstance(last_stmt, ast.Expr) and 
-                                not isinstance(last_stmt.value, ast.Call) or
-                                isinstance(last_stmt, ast.Assign)):
-                                # Check if there are calculations that might need returning
-                                has_calculation = any(
-                                    isinstance(stmt, ast.Assign) and
-                                    isinstance(stmt.value, (ast.BinOp, ast.Call))
-                                    for stmt in node.body
-                                )
-                                if has_calculation:
-                                    self.suggestions.append(f"Consider if function '{node.name}' should return a computed value")
-            except:
-                pass
-    
-    def _check_naming_conventions(self, code: str):
-        """Check Python naming conventions"""
-        lines = code.split('\n')
+        Feedback that is not tied to a line (such as the magic number
+        count) is left out.
         
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            
-            # Check for camelCase variables (should be snake_case)
-            camel_case_pattern = r'\b[a-z]+[A-Z][a-zA-Z]*\b'
-            if re.search(camel_case_pattern, line) and not line.startswith('#'):
-                matches = re.findall(camel_case_pattern, line)
-                for match in matches:
-                    if match not in ['firstName', 'lastName', 'userName']:  # Common exceptions
-                        snake_case = re.sub(r'([A-Z])', r'_\1', match).lower()
-                        self.suggestions.append(f"Line {line_num}: Consider using snake_case '{snake_case}' instead of camelCase '{match}'")
-            
-            # Check for ALL_CAPS variables that aren't constants
-            if '=' in line and not line.startswith('#'):
-                var_name = line.split('=')[0].strip()
-                if var_name.isupper() and len(var_name) > 1 and not var_name.startswith('_'):
-                    if not self._is_constant_assignment(line):
-                        self.suggestions.append(f"Line {line_num}: ALL_CAPS should be reserved for constants")
+        Args:
+            code: Python code string to analyze
             
-            # Check for single-letter variable names (except common ones)
-            single_letter_pattern = r'\b[a-z]\s*='
-            if re.search(single_letter_pattern, line) and not any(x in line for x in ['for ', 'in range', 'enumerate']):
-                matches = re.findall(r'\b([a-z])\s*=', line)
-                for match in matches:
-                    if match not in ['i', 'j', 'k', 'x', 'y', 'z', 'n']:
-                        self.suggestions.append(f"Line {line_num}: Consider using descriptive variable names instead of single letter '{match}'")
-    
-    def _check_code_style(self, code: str):
-        """Check code style and formatting"""
+        Returns:
+            st_ace annotations: dictionaries with "row", "column", "type" and "text"
+        """
+        rules = self._active_rules()
         lines = code.split('\n')
+        blocks = split_blocks(code)
+        annotations = []
         
-        for line_num, line in enumerate(lines, 1):
-            # Check line length
-            if len(line) > 100:
-                self.suggestions.append(f"Line {line_num}: Consider breaking long lines (current: {len(line)} chars)")
-            
-            # Check for missing spaces around operators (exclude strings)
-            if not line.strip().startswith('#') and '"' not in line and "'" not in line:
-                operators = ['+', '-', '*', '/', '=', '==', '!=', '<', '>', '<=', '>=']
-                for op in operators:
-                    if op in line:
-                        # Simple check for missing spaces (not perfect but helpful)
-                        pattern = rf'[a-zA-Z0-9]{re.escape(op)}[a-zA-Z0-9]'
-                        if re.search(pattern, line):
-                            self.suggestions.append(f"Line {line_num}: Consider adding spaces around operator '{op}'")
-                            break
+        index = 0
+        while index < len(blocks):
+            first = blocks[index][0]
+            findings, last = self._block_findings(lines, blocks, index, rules)
             
-            # Check for missing spaces after commas
-            if ',' in line and ',  ' not in line and ', ' not in line:
-                comma_pattern = r',[a-zA-Z0-9]'
-                if re.search(comma_pattern, line):
-                    self.suggestions.append(f"Line {line_num}: Consider adding space after comma")
+            for kind, annotation_type in ANNOTATION_TYPES.items():
+                for line, message in findings[kind]:
+                    if line is not None:
+                        text = SYNTAX_LOCATION_PATTERN.sub('', LINE_PREFIX_PATTERN.sub('', message))
+                        annotations.append({
+                            "row": first + line - 1,
+                            "column": 0,
+                            "type": annotation_type,
+                            "text": text
+                        })
+            index = last + 1
         
-        # Check for consistent indentation
-        indent_sizes = []
-        has_tabs = False
-        
-        for line in lines:
-            if line.strip() and (line.startswith(' ') or line.startswith('\t')):
-                if line.startswith('\t'):
-                    has_tabs = True
-                leading_spaces = len(line) - len(line.lstrip())
-                if leading_spaces > 0:
-                    indent_sizes.append(leading_spaces)
-        
-        if has_tabs:
-            self.suggestions.append("Consider using spaces instead of tabs for indentation")
-        
-        if indent_sizes:
-            # Check if all indentations are multiples of 4
-            non_four_multiples = [size for size in indent_sizes if size % 4 != 0]
-            if non_four_multiples:
-                self.suggestions.append("Consider using 4-space indentation for consistency")
+        return annotations
     
-    def _check_best_practices(self, code: str):
-        """Check for Python best practices"""
-        lines = code.split('\n')
-        
-        # Check for string concatenation in loops
-        in_loop = False
-        for line_num, line in enumerate(lines, 1):
-            line_stripped = line.strip()
-            
-            if line_stripped.startswith('for ') or line_stripped.startswith('while '):
-                in_loop = True
-            elif line_stripped == '' or not line.startswith(' '):
-                in_loop = False
-            
-            if in_loop and '+=' in line and any(quote in line for quote in ['"', "'"]):
-                self.best_practices.append(f"Line {line_num}: Consider using join() or f-strings for string concatenation in loops")
-        
-        # Check for hardcoded values that could be constants
-        magic_numbers = re.findall(r'\b\d{2,}\b', code)
-        if magic_numbers:
-            unique_numbers = set(magic_numbers)
-            if len(unique_numbers) > 2:
-                self.best_practices.append("Consider defining magic numbers as named constants for better readability")
-        
-        # Check for exception handling best practices
-        if 'except:' in code:
-            self.best_practices.append("Consider catching specific exceptions instead of using bare 'except:'")
-        
-        # Check for proper use of list comprehensions using AST
-        if 'def ' in code or 'for ' in code:
-            try:
-                tree = ast.parse(code)
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.For):
-                        # Check if the loop body only contains simple append operations
-                        if (len(node.body) == 1 and 
-                            isinstance(node.body[0], ast.Expr) and
-                            isinstance(node.body[0].value, ast.Call) and
-                            isinstance(node.body[0].value.func, ast.Attribute) and
-                            node.body[0].value.func.attr == 'append'):
-                            self.best_practices.append("Consider using list comprehension for simple append operations")
-            except:
-                pass
-        
-        # Check for proper function documentation
-        if 'def ' in code:
-            try:
-                tree = ast.parse(code)
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.FunctionDef):
-                        # Check if function has docstring using ast.get_docstring
-                        if ast.get_docstring(node) is None:
-                            self.best_practices.append(f"Function '{node.name}' could benefit from a docstring")
-            except:
-                pass
+    def get_block_cache_stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters of the incremental block cache"""
+        return self._block_cache.stats()
     
-    def _check_complexity(self, code: str):
-        """Check code complexity and suggest improvements"""
-        lines = code.split('\n')
-        
-        # Count nested levels
-        max_nesting = 0
-        current_nesting = 0
-        
-        for line in lines:
-            stripped = line.strip()
-            if stripped:
-                # Calculate indentation level
-                indent_level = (len(line) - len(line.lstrip())) // 4
-                
-                if any(stripped.startswith(keyword) for keyword in ['if', 'for', 'while', 'try', 'with']):
-                    current_nesting = indent_level + 1
-                    max_nesting = max(max_nesting, current_nesting)
-        
-        if max_nesting > 3:
-            self.suggestions.append(f"Consider breaking down complex nested code (nesting level: {max_nesting})")
-        
-        # Check function length
-        function_lines = {}
-        current_function = None
-        
-        for line_num, line in enumerate(lines, 1):
-            stripped = line.strip()
-            if stripped.startswith('def '):
-                current_function = stripped.split('(')[0].replace('def ', '')
-                function_lines[current_function] = [line_num]
-            elif current_function and (not line.startswith(' ') or not stripped):
-                if stripped and not line.startswith(' '):
-                    current_function = None
-            elif current_function:
-                function_lines[current_function].append(line_num)
+    def _active_rules(self) -> Tuple[str, ...]:
+        return self.rules if self.rules is not None else resolve_rules()
+    
+    def _block_findings(self, lines: List[str], blocks: List[Tuple[int, int]], index: int,
+                        rules: Tuple[str, ...]) -> Tuple[Dict[str, list], int]:
+        """Findings for the block at index, merged with the next blocks if that makes it parse"""
+        def analyze(last):
+            source = '\n'.join(lines[blocks[index][0]:blocks[last][1]])
+            return self._block_cache.get_or_compute(
+                content_hash(source, *rules),
+                lambda: self._collect_findings(source, rules)
+            )
         
-        for func_name, line_numbers in function_lines.items():
-            if len(line_numbers) > 20:
-                self.suggestions.append(f"Function '{func_name}' is quite long ({len(line_numbers)} lines). Consider breaking it into smaller functions")
+        findings = analyze(index)
+        if findings["warnings"]:
+            for last in range(index + 1, min(index + MAX_MERGED_BLOCKS, len(blocks))):
+                merged = analyze(last)
+                if not merged["warnings"]:
+                    return merged, last
+        return findings, index
+    
+    def _parse(self, code: str) -> Tuple[AnalysisContext, List[Tuple[int | None, str]]]:
+        """Parse code into the context rules share, with a warning if it is not valid Python"""
+        warnings = []
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            warnings.append((e.lineno, f"Syntax Error: {str(e)}"))
+            tree = None
+        return AnalysisContext(code, tree), warnings
     
-    def _is_constant_assignment(self, line: str) -> bool:
-        """Check if a line assigns a constant value"""
-        # Simple heuristic: if right side is a literal
-        if '=' in line:
-            right_side = line.split('=', 1)[1].strip()
-            # Check if it's a number, string, or simple expression
-            return (right_side.isdigit() or 
-                   right_side.startswith('"') or 
-                   right_side.startswith("'") or
-                   right_side in ['True', 'False', 'None'])
-        return False
+    def _collect_findings(self, code: str, rules: Tuple[str, ...]) -> Dict[str, List[Tuple[int | None, str]]]:
+        """Run the syntax check and the given rules, returning (line, message) pairs per kind of feedback"""
+        context, warnings = self._parse(code)
+        findings = run_rules(context, rules)
+        findings["warnings"] = warnings
+        return findings
     
     def _calculate_quality_score(self) -> int:
         """Calculate a quality score from 0-100"""
@@ -272,18 +219,30 @@ class CodeQualityAnalyzer:
         
         return max(0, min(100, base_score))
 
-def analyze_code_quality(code: str) -> Dict[str, Any]:
+def analyze_code_quality(code: str, rules: Optional[Iterable[str]] = None) -> Dict[str, Any]:
     """
     Public function to analyze code quality
     
+    Identical code is analyzed once per process: starter code, resubmissions
+    and the feedback shown after a passing submission all reuse the result.
+    
     Args:
         code: Python code string to analyze
+        rules: Names of the rules to run (see resolve_rules); None runs
+            every rule currently enabled
         
     Returns:
         Dictionary with analysis results
     """
-    analyzer = CodeQualityAnalyzer()
-    return analyzer.analyze_code(code)
+    rules = tuple(rules) if rules is not None else resolve_rules()
+    key = content_hash(code, str(RULESET_VERSION), *rules)
+    analysis = _analysis_cache.get_or_compute(key, lambda: CodeQualityAnalyzer(rules).analyze_code(code))
+    # Callers get their own copy so the cached result cannot be modified
+    return copy.deepcopy(analysis)
+
+def get_analysis_cache_stats() -> Dict[str, Any]:
+    """Return size and hit/miss counters of the shared analysis cache"""
+    return _analysis_cache.stats()
 
 def format_feedback(analysis: Dict[str, Any]) -> str:
     """
@@ -326,4 +285,15 @@ def format_feedback(analysis: Dict[str, Any]) -> str:
         for practice in analysis['best_practices']:
             feedback.append(f"• {practice}")
     
+    # Add per-function complexity
+    metrics = analysis.get('metrics')
+    if metrics and metrics['functions']:
+        feedback.append("\n📈 **Complexity:**")
+        for function in metrics['functions']:
+            feedback.append(
+                f"• `{function['qualname']}`: cyclomatic {function['cyclomatic']}, "
+                f"cognitive {function['cognitive']}, nesting {function['max_nesting']}, "
+                f"{function['statements']} statements"
+            )
+    
     return '\n'.join(feedback) if feedback else "✅ No issues found!"
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+Per-function complexity metrics computed from the syntax tree in one pass
+"""
+
+import ast
+from typing import Dict, Any, List, Optional
+
+class _UnitMetrics:
+    """Counters for one function, or for the module-level code"""
+
+    def __init__(self, name: str, qualname: str, lineno: int, end_lineno: int):
+        self.name = name
+        self.qualname = qualname
+        self.lineno = lineno
+        self.end_lineno = end_lineno
+        self.statements = 0
+        self.cyclomatic = 1
+        self.cognitive = 0
+        self.max_nesting = 0
+        self.nesting_line = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "qualname": self.qualname,
+            "lineno": self.lineno,
+            "end_lineno": self.end_lineno,
+            "lines": self.end_lineno - self.lineno + 1,
+            "statements": self.statements,
+            "cyclomatic": self.cyclomatic,
+            "cognitive": self.cognitive,
+            "max_nesting": self.max_nesting,
+            "nesting_line": self.nesting_line
+        }
+
+class _MetricsVisitor(ast.NodeVisitor):
+    """Walks a module once, charging each node to the innermost enclosing function
+
+    Cyclomatic complexity is one plus the number of decision points. Cognitive
+    complexity follows the SonarSource definition: branches and loops cost one
+    plus the depth of nesting they appear at, elif/else and each run of
+    and/or cost one, and a function calling itself costs one. Nesting depth
+    counts nested if/for/while/try/with/match blocks; an elif stays at the
+    depth of its if.
+    """
+
+    def __init__(self, tree: ast.Module):
+        body = getattr(tree, 'body', [])
+        end_lineno = getattr(body[-1], 'end_lineno', None) or body[-1].lineno if body else 1
+        self.module = _UnitMetrics("<module>", "<module>", 1, end_lineno)
+        self.functions: List[_UnitMetrics] = []
+        self.unit = self.module
+        self.scope: List[str] = []
+        # Depth of nesting that cognitive complexity charges for
+        self.nesting = 0
+        # Depth of nested blocks in the current function
+        self.depth = 0
+        self._continued_bool_ops = set()
+
+    def visit(self, node: ast.AST):
+        if isinstance(node, ast.stmt):
+            self.unit.statements += 1
+        return super().visit(node)
+
+    def _visit_all(self, nodes: List[ast.AST]):
+        for node in nodes:
+            self.visit(node)
+
+    def _visit_block(self, body: List[ast.stmt], line: int, nest: bool = True):
+        """Visit the statements of a nested block, one level deeper
+
+        nest is False for try and with blocks, which deepen the code
+        without adding to its cognitive complexity.
+        """
+        if not body:
+            return
+        self.depth += 1
+        if self.depth > self.unit.max_nesting:
+            self.unit.max_nesting = self.depth
+            self.unit.nesting_line = line
+        self.nesting += nest
+        self._visit_all(body)
+        self.nesting -= nest
+        self.depth -= 1
+
+    def _branch(self):
+        """Charge an if, loop or handler at the current nesting"""
+        self.unit.cyclomatic += 1
+        self.unit.cognitive += 1 + self.nesting
+
+    def visit_FunctionDef(self, node):
+        # Decorators and defaults run in the enclosing scope
+        self._visit_all(node.decorator_list)
+        self.visit(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+
+        qualname = '.'.join(self.scope + [node.name])
+        unit = _UnitMetrics(node.name, qualname, node.lineno, getattr(node, 'end_lineno', None) or node.lineno)
+        self.functions.append(unit)
+
+        saved = self.unit, self.nesting, self.depth
+        self.unit, self.nesting, self.depth = unit, 0, 0
+        self.scope.append(node.name)
+        self._visit_all(node.body)
+        self.scope.pop()
+        self.unit, self.nesting, self.depth = saved
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._visit_all(node.decorator_list)
+        self._visit_all(node.bases)
+        self._visit_all(node.keywords)
+        self.scope.append(node.name)
+        self._visit_all(node.body)
+        self.scope.pop()
+
+    def visit_If(self, node):
+        self._branch()
+        while True:
+            self.visit(node.test)
+            self._visit_block(node.body, node.lineno)
+            orelse = node.orelse
+            if len(orelse) == 1 and isinstance(orelse[0], ast.If) and orelse[0].col_offset == node.col_offset:
+                # An elif: one more decision at the if's depth
+                node = orelse[0]
+                self.unit.statements += 1
+                self.unit.cyclomatic += 1
+                self.unit.cognitive += 1
+                continue
+            if orelse:
+                self.unit.cognitive += 1
+                self._visit_block(orelse, orelse[0].lineno)
+            break
+
+    def _visit_loop(self, node, header: List[ast.AST]):
+        self._branch()
+        self._visit_all(header)
+        self._visit_block(node.body, node.lineno)
+        if node.orelse:
+            self.unit.cognitive += 1
+            self._visit_block(node.orelse, node.orelse[0].lineno)
+
+    def visit_For(self, node):
+        self._visit_loop(node, [node.target, node.iter])
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node):
+        self._visit_loop(node, [node.test])
+
+    def visit_Try(self, node):
+        self._visit_block(node.body, node.lineno, nest=False)
+        for handler in node.handlers:
+            self.visit(handler)
+        self._visit_block(node.orelse, node.lineno, nest=False)
+        self._visit_block(node.finalbody, node.lineno, nest=False)
+
+    visit_TryStar = visit_Try
+
+    def visit_ExceptHandler(self, node):
+        self._branch()
+        if node.type is not None:
+            self.visit(node.type)
+        # Handlers are alternatives to the try body, at its depth
+        self._visit_block(node.body, node.lineno)
+
+    def visit_With(self, node):
+        self._visit_all(node.items)
+        self._visit_block(node.body, node.lineno, nest=False)
+
+    visit_AsyncWith = visit_With
+
+    def visit_Match(self, node):
+        self.unit.cognitive += 1 + self.nesting
+        self.visit(node.subject)
+        for case in node.cases:
+            self.unit.cyclomatic += 1
+            self.visit(case.pattern)
+            if case.guard is not None:
+                self.visit(case.guard)
+            self._visit_block(case.body, node.lineno)
+
+    def visit_IfExp(self, node):
+        self._branch()
+        self.nesting += 1
+        self.generic_visit(node)
+        self.nesting -= 1
+
+    def visit_BoolOp(self, node):
+        self.unit.cyclomatic += len(node.values) - 1
+        if node in self._continued_bool_ops:
+            self._continued_bool_ops.discard(node)
+        else:
+            self.unit.cognitive += 1
+        for value in node.values:
+            if isinstance(value, ast.BoolOp) and type(value.op) is type(node.op):
+                self._continued_bool_ops.add(value)
+            self.visit(value)
+
+    def visit_comprehension(self, node):
+        # Each generator loops and each condition filters
+        self.unit.cyclomatic += 1 + len(node.ifs)
+        self.generic_visit(node)
+
+    def visit_Lambda(self, node):
+        self.nesting += 1
+        self.generic_visit(node)
+        self.nesting -= 1
+
+    def visit_Call(self, node):
+        if (self.unit is not self.module and isinstance(node.func, ast.Name)
+                and node.func.id == self.unit.name):
+            self.unit.cognitive += 1
+        self.generic_visit(node)
+
+def compute_metrics(tree: Optional[ast.AST]) -> Optional[Dict[str, Any]]:
+    """
+    Measure every function of a parsed module in one traversal
+
+    Nested functions and methods are measured on their own and not counted
+    towards the function that contains them; code outside any function is
+    measured as the module.
+
+    Args:
+        tree: Module parsed with ast.parse, or None if the code did not parse
+
+    Returns:
+        Dictionary with "functions" (one entry per function in source order,
+        with name, qualname, lineno, end_lineno, lines, statements,
+        cyclomatic, cognitive, max_nesting and nesting_line), "module" (the
+        same counters for module-level code) and "totals", or None for no tree
+    """
+    if tree is None:
+        return None
+
+    visitor = _MetricsVisitor(tree)
+    visitor._visit_all(getattr(tree, 'body', []))
+    units = [visitor.module] + visitor.functions
+    functions = [unit.to_dict() for unit in visitor.functions]
+
+    return {
+        "functions": functions,
+        "module": visitor.module.to_dict(),
+        "totals": {
+            "functions": len(functions),
+            "statements": sum(unit.statements for unit in units),
+            "cyclomatic": sum(unit.cyclomatic for unit in units),
+            "cognitive": sum(unit.cognitive for unit in units),
+            "max_cyclomatic": max(unit.cyclomatic for unit in units),
+            "max_cognitive": max(unit.cognitive for unit in units),
+            "max_nesting": max(unit.max_nesting for unit in units)
+        }
+    }
+
+def measure_complexity(code: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse code and measure it, without running any quality rules
+
+    Cheaper than a full analysis when only the numbers are needed, such as
+    when ranking many submissions or exercises by complexity.
+
+    Args:
+        code: Python code string
+
+    Returns:
+        compute_metrics result, or None if the code does not parse
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    return compute_metrics(tree)
@@ -7,6 +7,10 @@ import os
 from datetime import datetime
 from typing import List, Dict, Any
 
+from code_executor import compile_code
+from sandbox_profiles import resolve_profile
+from quality_rules import resolve_rules
+
 class CustomExerciseManager:
     """Manages custom exercises created by users"""
     
@@ -74,6 +78,16 @@ class CustomExerciseManager:
                 "tags": exercise_data.get('tags', [])
             }
             
+            # Keep an explicit sandbox profile, rejecting one that cannot be resolved
+            if exercise_data.get('sandbox'):
+                exercise["sandbox"] = dict(exercise_data['sandbox'])
+                resolve_profile(exercise)
+            
+            # Same for the quality rules switched on or off for this exercise
+            if exercise_data.get('quality_rules'):
+                exercise["quality_rules"] = dict(exercise_data['quality_rules'])
+                resolve_rules(exercise)
+            
             self.custom_exercises['exercises'].append(exercise)
             self.save_custom_exercises()
             return True
@@ -144,8 +158,9 @@ def validate_test_case(test_case_text: str) -> bool:
         True if valid, False otherwise
     """
     try:
-        # Try to compile the test case to check for syntax errors
-        compile(test_case_text, '<test_case>', 'exec')
+        # Try to compile the test case to check for syntax errors; the compiled
+        # code is cached so running the test later does not compile it again
+        compile_code(test_case_text)
         return True
     except SyntaxError:
         return False
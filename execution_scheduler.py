@@ -0,0 +1,186 @@
+"""
+Admission control with priority lanes for code executions
+"""
+
+import time
+import itertools
+import threading
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator
+
+from execution_watchdog import CancelToken, ExecutionCancelled
+
+# Lanes in priority order: interactive runs > submissions > bulk re-grading
+LANES = ("interactive", "submit", "batch")
+
+DEFAULT_MAX_QUEUED = {
+    "interactive": 200,
+    "submit": 200,
+    "batch": 1000,
+}
+
+# How often a waiting request checks whether it has been cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+# Longest a request waits in its lane before it is turned away
+DEFAULT_MAX_WAIT = {
+    "interactive": 30.0,
+    "submit": 60.0,
+    "batch": None,
+}
+
+class SchedulerBusy(Exception):
+    """Raised when a lane's queue is full or a request waited too long"""
+    pass
+
+class _Ticket:
+    def __init__(self, seq: int, lane: str, session_id: Optional[str]):
+        self.seq = seq
+        self.lane = lane
+        self.session_id = session_id
+        self.enqueued_at = time.monotonic()
+
+class _LaneStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+class ExecutionScheduler:
+    """Admits executions in priority order, never more than capacity at once
+
+    Each lane has a bounded queue; a full queue rejects new requests
+    immediately (backpressure) instead of letting them pile up. A session
+    never has more than max_per_session executions running, so one user
+    cannot take over the pool.
+    """
+
+    def __init__(self, capacity: int, max_per_session: int = 1,
+                 max_queued: Optional[Dict[str, int]] = None,
+                 max_wait: Optional[Dict[str, Optional[float]]] = None):
+        """
+        Args:
+            capacity: Executions allowed to run at once (normally the pool size)
+            max_per_session: Executions one session may have running at once
+            max_queued: Queue length per lane (defaults to DEFAULT_MAX_QUEUED)
+            max_wait: Seconds a request may wait per lane (defaults to DEFAULT_MAX_WAIT)
+        """
+        self.capacity = capacity
+        self.max_per_session = max_per_session
+        self.max_queued = dict(DEFAULT_MAX_QUEUED, **(max_queued or {}))
+        self.max_wait = dict(DEFAULT_MAX_WAIT, **(max_wait or {}))
+        self._queues = {lane: deque() for lane in LANES}
+        self._stats = {lane: _LaneStats() for lane in LANES}
+        self._running = 0
+        self._running_by_session = defaultdict(int)
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _session_full(self, session_id: Optional[str]) -> bool:
+        return session_id is not None and self._running_by_session[session_id] >= self.max_per_session
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """The ticket that should run next: highest lane first, FIFO within a lane"""
+        for lane in LANES:
+            for ticket in self._queues[lane]:
+                if not self._session_full(ticket.session_id):
+                    return ticket
+        return None
+
+    def _acquire(self, lane: str, session_id: Optional[str],
+                 cancel_token: Optional[CancelToken]) -> _Ticket:
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {', '.join(LANES)}")
+
+        with self._cond:
+            queue = self._queues[lane]
+            stats = self._stats[lane]
+            if len(queue) >= self.max_queued[lane]:
+                stats.rejected += 1
+                raise SchedulerBusy(f"Too many {lane} requests are waiting")
+
+            ticket = _Ticket(next(self._counter), lane, session_id)
+            queue.append(ticket)
+
+            max_wait = self.max_wait[lane]
+            deadline = ticket.enqueued_at + max_wait if max_wait is not None else None
+            while self._running >= self.capacity or self._next_ticket() is not ticket:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    queue.remove(ticket)
+                    stats.rejected += 1
+                    # Our departure may unblock someone behind us
+                    self._cond.notify_all()
+                    raise SchedulerBusy(f"Waited more than {max_wait} seconds in the {lane} queue")
+                if cancel_token is not None:
+                    if cancel_token.cancelled:
+                        queue.remove(ticket)
+                        stats.cancelled += 1
+                        self._cond.notify_all()
+                        raise ExecutionCancelled()
+                    remaining = min(remaining, CANCEL_POLL_INTERVAL) if remaining is not None else CANCEL_POLL_INTERVAL
+                self._cond.wait(remaining)
+
+            queue.remove(ticket)
+            self._running += 1
+            if session_id is not None:
+                self._running_by_session[session_id] += 1
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats.admitted += 1
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+            return ticket
+
+    def _release(self, ticket: _Ticket):
+        with self._cond:
+            self._running -= 1
+            if ticket.session_id is not None:
+                self._running_by_session[ticket.session_id] -= 1
+                if not self._running_by_session[ticket.session_id]:
+                    del self._running_by_session[ticket.session_id]
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: str = "interactive", session_id: Optional[str] = None,
+             cancel_token: Optional[CancelToken] = None) -> Iterator[None]:
+        """
+        Wait for permission to run one execution
+
+        Args:
+            lane: "interactive", "submit" or "batch"
+            session_id: Identifies the user session for the per-session cap
+            cancel_token: Token whose cancellation withdraws the request from the queue
+
+        Raises:
+            SchedulerBusy: The lane is full or the request waited too long
+            ExecutionCancelled: The request was cancelled while waiting
+        """
+        ticket = self._acquire(lane, session_id, cancel_token)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return running count and per-lane queue depth, admissions and wait times"""
+        with self._cond:
+            lanes = {}
+            for lane in LANES:
+                stats = self._stats[lane]
+                lanes[lane] = {
+                    "queued": len(self._queues[lane]),
+                    "admitted": stats.admitted,
+                    "rejected": stats.rejected,
+                    "cancelled": stats.cancelled,
+                    "mean_wait": stats.total_wait / stats.admitted if stats.admitted else 0.0,
+                    "max_wait": stats.max_wait
+                }
+            return {
+                "running": self._running,
+                "capacity": self.capacity,
+                "lanes": lanes
+            }
@@ -0,0 +1,195 @@
+"""
+Deadline watchdog shared by all concurrent code executions
+"""
+
+import os
+import time
+import heapq
+import ctypes
+import itertools
+import threading
+from typing import Callable, Dict
+
+class Watchdog:
+    """Single background thread that fires callbacks when deadlines pass
+
+    Works from any thread and keeps one deadline per execution, so many
+    executions can be timed at once without a process-wide alarm.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def watch(self, seconds: float, callback: Callable[[], None]) -> int:
+        """
+        Schedule a callback to run once after the given number of seconds
+
+        Args:
+            seconds: Delay before the callback fires
+            callback: Function called on the watchdog thread
+
+        Returns:
+            Token that can be passed to cancel()
+        """
+        with self._cond:
+            token = next(self._counter)
+            self._callbacks[token] = callback
+            heapq.heappush(self._heap, (time.monotonic() + seconds, token))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="execution-watchdog", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+        return token
+
+    def cancel(self, token: int) -> bool:
+        """
+        Cancel a scheduled callback
+
+        Returns:
+            True if the callback was cancelled before it fired
+        """
+        with self._cond:
+            return self._callbacks.pop(token, None) is not None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+
+                deadline, token = self._heap[0]
+                if token not in self._callbacks:
+                    # Cancelled, drop it lazily
+                    heapq.heappop(self._heap)
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+
+                heapq.heappop(self._heap)
+                callback = self._callbacks.pop(token)
+
+            try:
+                callback()
+            except Exception:
+                pass
+
+class ExecutionCancelled(Exception):
+    """Raised when an execution is cancelled before it finished"""
+    pass
+
+class CancelToken:
+    """Lets one thread cancel work another thread is doing
+
+    Code doing cancellable work registers a callback that stops it (for
+    example by killing a worker process). Callbacks run under the token's
+    lock, so once remove_callback() returns the callback either has run
+    completely or never will.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> bool:
+        """
+        Cancel the work and run the registered callbacks
+
+        Returns:
+            True if this call cancelled it, False if it already was
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._cancelled = True
+            for callback in self._callbacks:
+                try:
+                    callback()
+                except Exception:
+                    pass
+            return True
+
+    def add_callback(self, callback: Callable[[], None]):
+        """
+        Register a callback to run on cancel()
+
+        Raises:
+            ExecutionCancelled: The token has already been cancelled
+        """
+        with self._lock:
+            if self._cancelled:
+                raise ExecutionCancelled()
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[], None]):
+        """Unregister a callback; after this returns it will not run"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+def interrupt_thread(thread_id: int, exception_type: type) -> bool:
+    """
+    Raise an exception asynchronously in another Python thread
+
+    The exception is delivered at the thread's next bytecode boundary, so
+    it cannot interrupt blocking C calls such as time.sleep(). Use
+    absorb_interrupt() to drop one that is no longer wanted.
+
+    Args:
+        thread_id: Identifier from threading.get_ident()
+        exception_type: Exception class to raise
+
+    Returns:
+        True if the thread was found
+    """
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), ctypes.py_object(exception_type)) == 1
+
+def absorb_interrupt(exception_type: type) -> bool:
+    """
+    Take delivery of an exception interrupt_thread() may have pending for
+    the calling thread, and drop it
+
+    Clearing it with PyThreadState_SetAsyncExc(NULL) instead leaves the
+    interpreter's eval breaker set on CPython 3.11, after which traced
+    code never gets past its first instruction. The exception can still
+    surface on the way into this function, so call it where that
+    exception is handled anyway.
+
+    Returns:
+        True if an exception was pending
+    """
+    try:
+        # A pending exception is delivered at the loop's backward jump
+        for _ in range(2):
+            pass
+    except exception_type:
+        return True
+    return False
+
+_watchdog = Watchdog()
+
+def _reset_after_fork():
+    # The watchdog thread does not survive fork, and its lock may have been
+    # held at fork time, so child processes start with a fresh one
+    global _watchdog
+    _watchdog = Watchdog()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_watchdog() -> Watchdog:
+    """Return the process-wide watchdog"""
+    return _watchdog
@@ -260,6 +260,10 @@ print(result)""",
             "test_cases": [{
                 "test": "result = calculate_area(5, 3)\nassert result == 15",
                 "expected": "15"
+            }, {
+                "function": "calculate_area",
+                "args": [[5, 3], [0, 4], [2.5, 4], [1, 1], [10, 10], [7, 0.5]],
+                "returns": [15, 0, 10.0, 1, 100, 3.5]
             }]
         }, {
             "id":
@@ -537,7 +541,9 @@ Note: Use time.time() for timing measurements.
             "starter_code":
             "import time\n\ndef timer(func):\n    \"\"\"Decorator to measure function execution time\"\"\"\n    def wrapper(*args, **kwargs):\n        # Your decorator logic here\n        pass\n    return wrapper\n\n@timer\ndef slow_function():\n    \"\"\"Simulate a slow function\"\"\"\n    # Simulate work (use a simple loop instead of time.sleep)\n    total = 0\n    for i in range(1000000):\n        total += i\n    return total\n\n# Call the decorated function\nresult = slow_function()\nprint(f\"Result: {result}\")\n",
             "example":
-            """def timer(func):
+            """import time
+
+def timer(func):
     def wrapper(*args, **kwargs):
         start = time.time()
         result = func(*args, **kwargs)
@@ -623,7 +629,9 @@ Context managers help manage resources and ensure cleanup happens.
             "starter_code":
             "import time\n\nclass Timer:\n    \"\"\"A simple timer context manager\"\"\"\n    \n    def __enter__(self):\n        # Your code here\n        pass\n    \n    def __exit__(self, exc_type, exc_val, exc_tb):\n        # Your code here\n        pass\n\n# Use the context manager\nwith Timer():\n    # Simulate some work\n    total = sum(range(100000))\n    print(f\"Sum calculated: {total}\")\n",
             "example":
-            """class Timer:
+            """import time
+
+class Timer:
     def __enter__(self):
         self.start = time.time()
         print("Timer started")
@@ -634,14 +642,14 @@ Context managers help manage resources and ensure cleanup happens.
         print(f"Timer stopped. Elapsed: {elapsed:.4f} seconds")
 
 with Timer():
-    result = sum(range(1000))
-    print(f"Result: {result}")""",
+    total = sum(range(100000))
+    print(f"Sum calculated: {total}")""",
             "hint":
             "__enter__ is called when entering the 'with' block, __exit__ is called when leaving. Store start time in self.start.",
             "test_cases": [{
                 "test":
                 "# Test context manager functionality\nassert total > 0  # Sum calculation should work\n# Timer context manager should execute without errors",
-                "expected": "Context manager working"
+                "expected": ""
             }]
         }]
     }
@@ -0,0 +1,395 @@
+"""
+Registry of the code quality rules run by CodeQualityAnalyzer
+"""
+
+import ast
+import re
+import time
+import threading
+from typing import List, Dict, Any, Tuple, Optional, Iterable
+
+from complexity_metrics import compute_metrics
+
+# Patterns used by the line checks, compiled once
+CAMEL_CASE_PATTERN = re.compile(r'\b[a-z]+[A-Z][a-zA-Z]*\b')
+UPPERCASE_LETTER_PATTERN = re.compile(r'([A-Z])')
+SINGLE_LETTER_PATTERN = re.compile(r'\b([a-z])\s*=')
+COMMA_PATTERN = re.compile(r',[a-zA-Z0-9]')
+MAGIC_NUMBER_PATTERN = re.compile(r'\b\d{2,}\b')
+
+# Operators checked for surrounding spaces, in reporting order
+OPERATOR_PATTERNS = [
+    (op, re.compile(rf'[a-zA-Z0-9]{re.escape(op)}[a-zA-Z0-9]'))
+    for op in ['+', '-', '*', '/', '=', '==', '!=', '<', '>', '<=', '>=']
+]
+
+CAMEL_CASE_EXCEPTIONS = {'firstName', 'lastName', 'userName'}
+SINGLE_LETTER_EXCEPTIONS = {'i', 'j', 'k', 'x', 'y', 'z', 'n'}
+
+# Complexity above which the complexity rule makes a suggestion
+MAX_NESTING_DEPTH = 3
+MAX_FUNCTION_LINES = 20
+MAX_CYCLOMATIC_COMPLEXITY = 10
+
+# Kinds of feedback a rule can report, as named in analysis results
+RULE_KINDS = ("suggestions", "best_practices")
+
+class AnalysisContext:
+    """Code parsed and split once, shared by every rule of one analysis
+
+    lines holds (line number, line, stripped line, is comment, leading
+    whitespace) for each line; nodes holds the syntax tree in ast.walk
+    order, or nothing if the code does not parse. metrics holds the
+    compute_metrics result, measured the first time it is asked for.
+    """
+
+    def __init__(self, code: str, tree: Optional[ast.AST]):
+        self.code = code
+        self.tree = tree
+        self.lines = []
+        for line_num, line in enumerate(code.split('\n'), 1):
+            stripped = line.strip()
+            self.lines.append((line_num, line, stripped, stripped.startswith('#'), len(line) - len(line.lstrip())))
+        self.nodes = list(ast.walk(tree)) if tree is not None else []
+        self._metrics = None
+
+    @property
+    def metrics(self) -> Optional[Dict[str, Any]]:
+        if self._metrics is None and self.tree is not None:
+            self._metrics = compute_metrics(self.tree)
+        return self._metrics
+
+class QualityRule:
+    """A check registered with register_rule
+
+    Subclasses set the metadata attributes and implement check(), which
+    returns (line number or None, message) pairs in reporting order.
+    """
+    name = ""
+    title = ""
+    description = ""
+    kind = "suggestions"
+    enabled_by_default = True
+
+    def check(self, context: AnalysisContext) -> List[Tuple[Optional[int], str]]:
+        raise NotImplementedError
+
+class _RuleStats:
+    def __init__(self):
+        self.runs = 0
+        self.findings = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+# Registered rules in reporting order
+RULE_REGISTRY: Dict[str, QualityRule] = {}
+
+_rule_stats: Dict[str, _RuleStats] = {}
+_stats_lock = threading.Lock()
+
+# Rules switched off process-wide, e.g. to shed expensive ones under load
+_disabled_rules = set()
+
+def register_rule(rule_class: type) -> type:
+    """
+    Class decorator adding a rule to the registry
+
+    Rules report in registration order, so each rule's feedback appears
+    after that of the rules registered before it.
+
+    Raises:
+        ValueError: The rule has no name, a duplicate name or an unknown kind
+    """
+    rule = rule_class()
+    if not rule.name or rule.name in RULE_REGISTRY:
+        raise ValueError(f"Rule name '{rule.name}' is missing or already registered")
+    if rule.kind not in RULE_KINDS:
+        raise ValueError(f"Rule '{rule.name}' has unknown kind '{rule.kind}'")
+
+    RULE_REGISTRY[rule.name] = rule
+    _rule_stats[rule.name] = _RuleStats()
+    return rule_class
+
+def _check_rule_names(names: Iterable[str]):
+    unknown = set(names) - set(RULE_REGISTRY)
+    if unknown:
+        raise ValueError(f"Unknown quality rule(s): {', '.join(sorted(unknown))}")
+
+def set_rule_enabled(name: str, enabled: bool):
+    """Switch a rule on or off for every analysis in this process"""
+    _check_rule_names([name])
+    if enabled:
+        _disabled_rules.discard(name)
+    else:
+        _disabled_rules.add(name)
+
+def resolve_rules(exercise: Optional[Dict[str, Any]] = None,
+                  track: Optional[Dict[str, Any]] = None) -> Tuple[str, ...]:
+    """
+    Get the rules an exercise is analyzed with
+
+    Args:
+        exercise: Exercise dictionary, optionally with a "quality_rules"
+            key mapping rule names to True or False
+        track: Specialized track dictionary, whose "quality_rules" apply
+            to all its exercises unless the exercise overrides them
+
+    Returns:
+        Enabled rule names in reporting order; rules switched off with
+        set_rule_enabled stay off
+
+    Raises:
+        ValueError: A "quality_rules" key names an unknown rule
+    """
+    enabled = {name: rule.enabled_by_default for name, rule in RULE_REGISTRY.items()}
+    for source in (track, exercise):
+        overrides = (source or {}).get('quality_rules') or {}
+        _check_rule_names(overrides)
+        enabled.update(overrides)
+
+    return tuple(name for name in RULE_REGISTRY if enabled[name] and name not in _disabled_rules)
+
+def run_rules(context: AnalysisContext, names: Iterable[str]) -> Dict[str, List[Tuple[Optional[int], str]]]:
+    """
+    Run the named rules over a shared context, timing each one
+
+    Args:
+        context: Parsed code
+        names: Rules to run; they report in registry order whatever the order given
+
+    Returns:
+        (line, message) pairs per kind of feedback
+    """
+    names = set(names)
+    findings = {kind: [] for kind in RULE_KINDS}
+    for name, rule in RULE_REGISTRY.items():
+        if name not in names:
+            continue
+        start = time.perf_counter()
+        found = rule.check(context)
+        elapsed = time.perf_counter() - start
+        findings[rule.kind].extend(found)
+
+        with _stats_lock:
+            stats = _rule_stats[name]
+            stats.runs += 1
+            stats.findings += len(found)
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+    return findings
+
+def get_rule_stats() -> Dict[str, Dict[str, Any]]:
+    """Return metadata, on/off state and timing counters for every registered rule"""
+    with _stats_lock:
+        return {
+            name: {
+                "title": rule.title,
+                "description": rule.description,
+                "kind": rule.kind,
+                "enabled": rule.enabled_by_default and name not in _disabled_rules,
+                "runs": _rule_stats[name].runs,
+                "findings": _rule_stats[name].findings,
+                "total_time": _rule_stats[name].total_time,
+                "mean_time": _rule_stats[name].total_time / _rule_stats[name].runs if _rule_stats[name].runs else 0.0,
+                "max_time": _rule_stats[name].max_time
+            }
+            for name, rule in RULE_REGISTRY.items()
+        }
+
+def reset_rule_stats():
+    """Zero the timing counters of every rule"""
+    with _stats_lock:
+        for name in _rule_stats:
+            _rule_stats[name] = _RuleStats()
+
+def _is_constant_assignment(line: str) -> bool:
+    """Check if a line assigns a constant value"""
+    # Simple heuristic: if right side is a literal
+    if '=' in line:
+        right_side = line.split('=', 1)[1].strip()
+        # Check if it's a number, string, or simple expression
+        return (right_side.isdigit() or
+               right_side.startswith('"') or
+               right_side.startswith("'") or
+               right_side in ['True', 'False', 'None'])
+    return False
+
+@register_rule
+class ReturnValueRule(QualityRule):
+    name = "return_value"
+    title = "Return values"
+    description = "Functions that compute a value but never return anything"
+
+    def check(self, context):
+        findings = []
+        if 'def ' not in context.code or 'return' in context.code:
+            return findings
+
+        for node in context.nodes:
+            # Only suggest if the last statement is an expression or assignment
+            if isinstance(node, ast.FunctionDef) and node.body:
+                last_stmt = node.body[-1]
+                if (isinstance(last_stmt, ast.Expr) and
+                    not isinstance(last_stmt.value, ast.Call) or
+                    isinstance(last_stmt, ast.Assign)):
+                    # Check if there are calculations that might need returning
+                    has_calculation = any(
+                        isinstance(stmt, ast.Assign) and
+                        isinstance(stmt.value, (ast.BinOp, ast.Call))
+                        for stmt in node.body
+                    )
+                    if has_calculation:
+                        findings.append((node.lineno, f"Consider if function '{node.name}' should return a computed value"))
+        return findings
+
+@register_rule
+class NamingRule(QualityRule):
+    name = "naming"
+    title = "Naming conventions"
+    description = "camelCase names, ALL_CAPS non-constants and single-letter variables"
+
+    def check(self, context):
+        findings = []
+        for line_num, _, stripped, is_comment, _ in context.lines:
+            # Check for camelCase variables (should be snake_case)
+            if not is_comment:
+                for match in CAMEL_CASE_PATTERN.findall(stripped):
+                    if match not in CAMEL_CASE_EXCEPTIONS:  # Common exceptions
+                        snake_case = UPPERCASE_LETTER_PATTERN.sub(r'_\1', match).lower()
+                        findings.append((line_num, f"Line {line_num}: Consider using snake_case '{snake_case}' instead of camelCase '{match}'"))
+
+            # Check for ALL_CAPS variables that aren't constants
+            if '=' in stripped and not is_comment:
+                var_name = stripped.split('=')[0].strip()
+                if var_name.isupper() and len(var_name) > 1 and not var_name.startswith('_'):
+                    if not _is_constant_assignment(stripped):
+                        findings.append((line_num, f"Line {line_num}: ALL_CAPS should be reserved for constants"))
+
+            # Check for single-letter variable names (except common ones)
+            if '=' in stripped and not any(x in stripped for x in ['for ', 'in range', 'enumerate']):
+                for match in SINGLE_LETTER_PATTERN.findall(stripped):
+                    if match not in SINGLE_LETTER_EXCEPTIONS:
+                        findings.append((line_num, f"Line {line_num}: Consider using descriptive variable names instead of single letter '{match}'"))
+        return findings
+
+@register_rule
+class StyleRule(QualityRule):
+    name = "style"
+    title = "Code style"
+    description = "Line length, spacing around operators and commas, and indentation"
+
+    def check(self, context):
+        findings = []
+        tab_line = None
+        misindented_line = None
+
+        for line_num, line, stripped, is_comment, leading_spaces in context.lines:
+            # Check line length
+            if len(line) > 100:
+                findings.append((line_num, f"Line {line_num}: Consider breaking long lines (current: {len(line)} chars)"))
+
+            # Check for missing spaces around operators (exclude strings)
+            if not is_comment and '"' not in line and "'" not in line:
+                for op, pattern in OPERATOR_PATTERNS:
+                    # Simple check for missing spaces (not perfect but helpful)
+                    if op in line and pattern.search(line):
+                        findings.append((line_num, f"Line {line_num}: Consider adding spaces around operator '{op}'"))
+                        break
+
+            # Check for missing spaces after commas
+            if ',' in line and ',  ' not in line and ', ' not in line:
+                if COMMA_PATTERN.search(line):
+                    findings.append((line_num, f"Line {line_num}: Consider adding space after comma"))
+
+            # Indentation consistency
+            if stripped and (line.startswith(' ') or line.startswith('\t')):
+                if line.startswith('\t') and tab_line is None:
+                    tab_line = line_num
+                # Check if all indentations are multiples of 4
+                if leading_spaces % 4 != 0 and misindented_line is None:
+                    misindented_line = line_num
+
+        if tab_line is not None:
+            findings.append((tab_line, "Consider using spaces instead of tabs for indentation"))
+        if misindented_line is not None:
+            findings.append((misindented_line, "Consider using 4-space indentation for consistency"))
+        return findings
+
+@register_rule
+class ComplexityRule(QualityRule):
+    name = "complexity"
+    title = "Complexity"
+    description = "Deeply nested code, long functions and functions with many branches"
+
+    def check(self, context):
+        findings = []
+        metrics = context.metrics
+        if metrics is None:
+            # Nothing to measure until the code parses
+            return findings
+
+        # Inside a function the def counts as a level too, as it always has
+        levels = [(metrics['module']['max_nesting'], metrics['module']['nesting_line'])]
+        levels += [(function['max_nesting'] + 1, function['nesting_line'])
+                   for function in metrics['functions'] if function['max_nesting']]
+        nesting, nesting_line = max(levels, key=lambda level: level[0])
+        if nesting > MAX_NESTING_DEPTH:
+            findings.append((nesting_line, f"Consider breaking down complex nested code (nesting level: {nesting})"))
+        for function in metrics['functions']:
+            if function['lines'] > MAX_FUNCTION_LINES:
+                findings.append((function['lineno'], f"Function '{function['name']}' is quite long ({function['lines']} lines). Consider breaking it into smaller functions"))
+            if function['cyclomatic'] > MAX_CYCLOMATIC_COMPLEXITY:
+                findings.append((function['lineno'], f"Function '{function['name']}' has many decision points (cyclomatic complexity: {function['cyclomatic']}). Consider splitting it up"))
+        return findings
+
+@register_rule
+class BestPracticesRule(QualityRule):
+    name = "best_practices"
+    title = "Best practices"
+    description = "String building in loops, magic numbers, bare except, append loops and docstrings"
+    kind = "best_practices"
+
+    def check(self, context):
+        findings = []
+        in_loop = False
+        magic_numbers = set()
+        bare_except = None
+
+        for line_num, line, stripped, _, _ in context.lines:
+            # String concatenation in loops
+            if stripped.startswith('for ') or stripped.startswith('while '):
+                in_loop = True
+            elif stripped == '' or not line.startswith(' '):
+                in_loop = False
+
+            if in_loop and '+=' in line and any(quote in line for quote in ['"', "'"]):
+                findings.append((line_num, f"Line {line_num}: Consider using join() or f-strings for string concatenation in loops"))
+
+            # Hardcoded values that could be constants
+            magic_numbers.update(MAGIC_NUMBER_PATTERN.findall(line))
+
+            # Exception handling
+            if bare_except is None and 'except:' in line:
+                bare_except = line_num
+
+        if len(magic_numbers) > 2:
+            findings.append((None, "Consider defining magic numbers as named constants for better readability"))
+        if bare_except is not None:
+            findings.append((bare_except, "Consider catching specific exceptions instead of using bare 'except:'"))
+
+        has_def = 'def ' in context.code
+        comprehensions = []
+        docstrings = []
+        for node in context.nodes:
+            if isinstance(node, ast.For) and (has_def or 'for ' in context.code):
+                # Check if the loop body only contains simple append operations
+                if (len(node.body) == 1 and
+                    isinstance(node.body[0], ast.Expr) and
+                    isinstance(node.body[0].value, ast.Call) and
+                    isinstance(node.body[0].value.func, ast.Attribute) and
+                    node.body[0].value.func.attr == 'append'):
+                    comprehensions.append((node.lineno, "Consider using list comprehension for simple append operations"))
+            # Check if function has docstring using ast.get_docstring
+            elif isinstance(node, ast.FunctionDef) and has_def and ast.get_docstring(node) is None:
+                docstrings.append((node.lineno, f"Function '{node.name}' could benefit from a docstring"))
+        return findings + comprehensions + docstrings
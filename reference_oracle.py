@@ -0,0 +1,161 @@
+"""
+Expected test outputs precomputed from each exercise's reference solution
+
+Run this module to rebuild the oracle file after changing exercises:
+
+    python reference_oracle.py
+"""
+
+import os
+import json
+from typing import Dict, Any, List, Iterable
+
+from caching import content_hash
+from code_executor import run_tests, is_batch_test, is_budget_test
+from sandbox_profiles import resolve_profile
+from exercises import get_exercises
+from specialized_tracks import get_specialized_tracks
+
+ORACLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference_oracle.json")
+
+# Bump when the way outputs are recorded changes, so old files are ignored
+ORACLE_VERSION = 1
+
+# Times each reference solution runs; outputs that differ between runs
+# (timings, random numbers) are not recorded
+ORACLE_RUNS = 2
+
+_oracle = None
+
+def oracle_key(example: str, test_case: Dict[str, Any]) -> str:
+    """
+    Key of one test case's expected output
+
+    Args:
+        example: Reference solution source
+        test_case: Test case dictionary
+
+    Returns:
+        Hash that changes whenever the solution or the test case changes
+    """
+    return content_hash(example, json.dumps(test_case, sort_keys=True))
+
+def _oracle_entries(exercise: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Run the exercise's example against its tests and keep the outputs worth trusting"""
+    example = exercise.get('example')
+    test_cases = exercise.get('test_cases', [])
+    if not example or not test_cases:
+        return {}
+
+    limits = resolve_profile(exercise).to_limits()
+    runs = [
+        run_tests(example, test_cases, priority="batch", use_cache=False, **limits)
+        for _ in range(ORACLE_RUNS)
+    ]
+    results = runs[0]
+    program_output = results['program'].get('output', '').strip()
+
+    entries = {}
+    for test_case, detail in zip(test_cases, results['details']):
+        if is_batch_test(test_case) or is_budget_test(test_case):
+            # Batch tests carry their own expected values or reference solution,
+            # and timing the example against itself proves nothing
+            continue
+        if not results['program']['success'] or detail['error'] or detail['truncated']:
+            # The example does not solve this test; keep the hand-written expectation
+            continue
+        if detail['passed']:
+            # The hand-written expectation is already right
+            continue
+        if detail['actual'] == program_output:
+            # The test prints nothing of its own, so it can only assert; an
+            # expectation it could never print becomes an assertion test
+            expected = ''
+        elif any(run['details'][detail['test_number'] - 1]['actual'] != detail['actual'] for run in runs[1:]):
+            # Nondeterministic output cannot serve as an expectation
+            continue
+        else:
+            expected = detail['actual']
+
+        entries[oracle_key(example, test_case)] = {
+            "exercise": exercise['id'],
+            "test_number": detail['test_number'],
+            "expected": expected
+        }
+    return entries
+
+def build_oracle(exercises: Iterable[Dict[str, Any]], filename: str = ORACLE_FILE) -> Dict[str, Any]:
+    """
+    Run every exercise's reference solution in the sandbox and save the outputs
+
+    Args:
+        exercises: Exercise dictionaries with "example" and "test_cases"
+        filename: Oracle file to write
+
+    Returns:
+        Dictionary with the number of exercises run and expected outputs recorded
+    """
+    global _oracle
+    entries = {}
+    exercise_count = 0
+    for exercise in exercises:
+        exercise_count += 1
+        entries.update(_oracle_entries(exercise))
+
+    with open(filename, 'w') as f:
+        json.dump({"version": ORACLE_VERSION, "entries": entries}, f, indent=2, sort_keys=True)
+    _oracle = None
+
+    return {"exercises": exercise_count, "entries": len(entries)}
+
+def load_oracle(filename: str = ORACLE_FILE) -> Dict[str, Dict[str, Any]]:
+    """Load the oracle entries once per process; a missing or outdated file gives none"""
+    global _oracle
+    if _oracle is None:
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+            _oracle = data.get('entries', {}) if data.get('version') == ORACLE_VERSION else {}
+        except (json.JSONDecodeError, FileNotFoundError):
+            _oracle = {}
+    return _oracle
+
+def resolve_test_cases(exercise: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Get an exercise's test cases with expectations taken from the oracle
+
+    Performance-graded tests also get the example as the reference
+    solution their time and memory budgets are relative to.
+
+    Args:
+        exercise: Exercise dictionary
+
+    Returns:
+        Test cases to pass to run_tests; tests without an oracle entry are unchanged
+    """
+    test_cases = exercise.get('test_cases', [])
+    example = exercise.get('example')
+    if not example:
+        return test_cases
+
+    oracle = load_oracle()
+    resolved = []
+    for test_case in test_cases:
+        entry = oracle.get(oracle_key(example, test_case))
+        if entry is not None:
+            test_case = dict(test_case, expected=entry['expected'])
+        if is_budget_test(test_case) and 'reference' not in test_case:
+            test_case = dict(test_case, reference=example)
+        resolved.append(test_case)
+    return resolved
+
+def bundled_exercises() -> List[Dict[str, Any]]:
+    """Every exercise shipped with the platform, including specialized tracks"""
+    exercises = [exercise for category in get_exercises().values() for exercise in category]
+    for track in get_specialized_tracks().values():
+        exercises.extend(track['exercises'])
+    return exercises
+
+if __name__ == "__main__":
+    summary = build_oracle(bundled_exercises())
+    print(f"Recorded {summary['entries']} expected outputs from {summary['exercises']} exercises")
@@ -0,0 +1,369 @@
+"""
+Pre-forked worker process pool used to run learner code outside the server process
+"""
+
+import gc
+import os
+import time
+import queue
+import signal
+import inspect
+import threading
+import multiprocessing
+from typing import Dict, Any, Callable, Optional, Iterator
+
+from execution_watchdog import get_watchdog, CancelToken, ExecutionCancelled
+
+# Seconds the spawner waits before trying again when fork() fails
+SPAWN_RETRY_INTERVAL = 1.0
+
+class WorkerTimeout(Exception):
+    """Raised when a worker does not answer a job before its deadline"""
+    pass
+
+class WorkerCrashed(Exception):
+    """Raised when a worker process dies while running a job"""
+
+    def __init__(self, exitcode: Optional[int]):
+        super().__init__(f"Worker process exited unexpectedly (exit code {exitcode})")
+        self.exitcode = exitcode
+
+def _resident_memory() -> int:
+    """Resident set size of this process in bytes, or 0 where it cannot be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _get_context():
+    """Prefer fork so workers inherit already-imported modules"""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+def _worker_main(conn, handler: Callable, warmup_job: Optional[Dict[str, Any]]):
+    """Worker loop: receive a job over the pipe, run it, send the reply back
+
+    The handler is called as handler(job, emit). Replies are ("done",
+    (reply, rss_growth)) tuples, where rss_growth is how far resident
+    memory has grown since startup. Before that, each item passed to emit()
+    is sent straight away as ("partial", item), and a handler that returns
+    a generator streams each yielded item the same way; the generator's
+    return value becomes the final reply.
+    """
+    def emit(item: Any):
+        conn.send(("partial", item))
+
+    # Lead a process group, so killing the worker also kills any
+    # processes the handler forks (which hold our end of the pipe)
+    if hasattr(os, 'setpgid'):
+        os.setpgid(0, 0)
+
+    if warmup_job is not None:
+        handler(warmup_job, lambda item: None)
+
+    # Objects inherited from the parent never need collecting; freezing
+    # them keeps the collector from touching (and copying) their pages
+    gc.freeze()
+    baseline = _resident_memory()
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        # None is the shutdown sentinel
+        if job is None:
+            break
+
+        reply = handler(job, emit)
+        if inspect.isgenerator(reply):
+            while True:
+                try:
+                    item = next(reply)
+                except StopIteration as stop:
+                    reply = stop.value
+                    break
+                emit(item)
+
+        # Reclaim cycles left behind by the job before reporting memory
+        gc.collect()
+        conn.send(("done", (reply, _resident_memory() - baseline)))
+
+class _Worker:
+    """Parent-side handle for one worker process and its pipe"""
+
+    def __init__(self, ctx, handler: Callable, warmup_job: Optional[Dict[str, Any]]):
+        self.tasks = 0
+        self.rss_growth = 0
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, handler, warmup_job),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        """Ask the worker to exit, killing it if it does not"""
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=1)
+        except (OSError, ValueError):
+            pass
+        self.kill()
+
+    def terminate(self):
+        """Kill the worker and any processes it forked, without waiting"""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            # No process group yet (or no killpg on this platform)
+            self.process.kill()
+
+    def kill(self):
+        """Terminate the worker process immediately"""
+        try:
+            self.terminate()
+            self.process.join(timeout=1)
+        finally:
+            self.conn.close()
+
+class SandboxPool:
+    """Runs jobs on a fixed set of pre-forked worker processes
+
+    Workers are recycled after max_tasks jobs, or once their resident
+    memory has grown by more than max_rss_growth_mb since startup, so
+    garbage learner code leaves behind cannot accumulate.
+
+    Workers are started and retired by one dedicated spawner thread. A
+    fork from a request thread would copy that thread's exception context
+    (a WorkerTimeout still propagating, say) into the new worker, where it
+    would be chained onto every exception learner code raises, and it
+    could copy locks the request thread holds.
+    """
+
+    def __init__(self, handler: Callable, workers: Optional[int] = None,
+                 warmup_job: Optional[Dict[str, Any]] = None,
+                 max_tasks: Optional[int] = None,
+                 max_rss_growth_mb: Optional[float] = None):
+        """
+        Start the worker processes
+
+        Args:
+            handler: Module-level function each worker calls with a job dict and
+                an emit(item) callable that streams a partial result to stream()
+            workers: Number of worker processes (defaults to the number of cores)
+            warmup_job: Job each worker runs once at startup so the first real job is hot
+            max_tasks: Jobs a worker runs before it is replaced (None for no limit)
+            max_rss_growth_mb: Memory growth after which a worker is replaced (None for no limit)
+        """
+        self.size = workers or os.cpu_count() or 1
+        self.max_tasks = max_tasks
+        self.max_rss_growth_mb = max_rss_growth_mb
+        self._ctx = _get_context()
+        self._handler = handler
+        self._warmup_job = warmup_job
+        self._idle = queue.Queue()
+        self._closed = False
+
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._busy = 0
+        self._tasks = 0
+        self._total_latency = 0.0
+        self._recycled = 0
+        self._replaced = 0
+
+        # (worker to retire or None, graceful) requests for the spawner;
+        # None stops it
+        self._replacements = queue.Queue()
+        self._spawner = threading.Thread(target=self._run_spawner, name="sandbox-pool-spawner", daemon=True)
+        self._spawner.start()
+        for _ in range(self.size):
+            self._replacements.put((None, True))
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx, self._handler, self._warmup_job)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _run_spawner(self):
+        """Spawner thread: retire the workers handed to it and start their replacements"""
+        while True:
+            request = self._replacements.get()
+            if request is None:
+                break
+            worker, graceful = request
+            if worker is not None:
+                self._retire(worker, graceful)
+            while not self._closed:
+                try:
+                    self._idle.put(self._spawn())
+                    break
+                except OSError:
+                    time.sleep(SPAWN_RETRY_INTERVAL)
+
+    def _retire(self, worker: _Worker, graceful: bool):
+        with self._lock:
+            self._workers.discard(worker)
+            if graceful:
+                self._recycled += 1
+            else:
+                self._replaced += 1
+        if graceful:
+            worker.stop()
+        else:
+            worker.kill()
+
+    def _needs_recycling(self, worker: _Worker) -> bool:
+        if self.max_tasks is not None and worker.tasks >= self.max_tasks:
+            return True
+        if self.max_rss_growth_mb is not None and worker.rss_growth > self.max_rss_growth_mb * 1024 * 1024:
+            return True
+        return False
+
+    def submit(self, job: Dict[str, Any], timeout: float,
+               cancel_token: Optional[CancelToken] = None) -> Dict[str, Any]:
+        """
+        Run a job on the next idle worker and wait for its reply
+
+        Args:
+            job: Picklable job dictionary passed to the handler
+            timeout: Seconds to wait for the reply before the watchdog kills the worker
+            cancel_token: Token whose cancellation kills the worker and abandons the job
+
+        Returns:
+            The handler's reply dictionary
+
+        Raises:
+            WorkerTimeout: The worker did not reply in time and was replaced
+            WorkerCrashed: The worker died while running the job and was replaced
+            ExecutionCancelled: The job was cancelled and its worker replaced
+        """
+        messages = self.stream(job, timeout, cancel_token)
+        while True:
+            try:
+                next(messages)
+            except StopIteration as stop:
+                return stop.value
+
+    def stream(self, job: Dict[str, Any], timeout: float,
+               cancel_token: Optional[CancelToken] = None) -> Iterator[Any]:
+        """
+        Run a job on the next idle worker, yielding its partial results as they arrive
+
+        The handler's final reply is the generator's return value. The
+        worker is held until the generator finishes; closing it early
+        kills and replaces the worker.
+
+        Args:
+            job: Picklable job dictionary passed to the handler
+            timeout: Seconds allowed for the whole job before the watchdog kills the worker
+            cancel_token: Token whose cancellation kills the worker and abandons the job
+
+        Raises:
+            WorkerTimeout: The worker did not finish in time and was replaced
+            WorkerCrashed: The worker died while running the job and was replaced
+            ExecutionCancelled: The job was cancelled and its worker replaced
+        """
+        if self._closed:
+            raise RuntimeError("Sandbox pool has been shut down")
+        if cancel_token is not None and cancel_token.cancelled:
+            raise ExecutionCancelled()
+
+        worker = self._idle.get()
+        healthy = False
+        timed_out = threading.Event()
+        cancelled = threading.Event()
+        started = time.perf_counter()
+        with self._lock:
+            self._busy += 1
+
+        def on_deadline():
+            timed_out.set()
+            worker.terminate()
+
+        def on_cancel():
+            cancelled.set()
+            worker.terminate()
+
+        watchdog = get_watchdog()
+        token = watchdog.watch(timeout, on_deadline)
+        try:
+            if cancel_token is not None:
+                cancel_token.add_callback(on_cancel)
+            worker.conn.send(job)
+            while True:
+                kind, payload = worker.conn.recv()
+                if kind == "done":
+                    healthy = True
+                    reply, worker.rss_growth = payload
+                    return reply
+                yield payload
+        except (EOFError, OSError):
+            if timed_out.is_set():
+                raise WorkerTimeout(f"Worker did not finish within {timeout} seconds")
+            if cancelled.is_set():
+                raise ExecutionCancelled()
+            worker.process.join(timeout=1)
+            raise WorkerCrashed(worker.process.exitcode)
+        finally:
+            # If the deadline fired or the job was cancelled after the reply
+            # arrived, the worker is already dead
+            if not watchdog.cancel(token):
+                healthy = False
+            if cancel_token is not None:
+                cancel_token.remove_callback(on_cancel)
+                if cancelled.is_set():
+                    healthy = False
+            worker.tasks += 1
+            with self._lock:
+                self._busy -= 1
+                self._tasks += 1
+                self._total_latency += time.perf_counter() - started
+
+            if healthy and not self._needs_recycling(worker):
+                self._idle.put(worker)
+            else:
+                # Never reuse a worker whose state is unknown
+                self._replacements.put((worker, healthy))
+
+    def health(self) -> Dict[str, Any]:
+        """Return busy/idle worker counts, recycling counts and mean task latency"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "busy": self._busy,
+                "idle": self._idle.qsize(),
+                "tasks": self._tasks,
+                "recycled": self._recycled,
+                "replaced": self._replaced,
+                "mean_latency": self._total_latency / self._tasks if self._tasks else 0.0,
+                "workers": [
+                    {
+                        "pid": worker.process.pid,
+                        "tasks": worker.tasks,
+                        "rss_growth": worker.rss_growth
+                    }
+                    for worker in self._workers
+                ]
+            }
+
+    def shutdown(self):
+        """Stop the spawner and all idle workers"""
+        self._closed = True
+        self._replacements.put(None)
+        self._spawner.join()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._workers.discard(worker)
+            worker.stop()
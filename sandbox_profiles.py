@@ -0,0 +1,88 @@
+"""
+Per-exercise sandbox profiles for the Python practice platform
+"""
+
+import json
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Any, Optional
+
+from caching import LRUCache
+from code_executor import DEFAULT_LIMITS, SANDBOX_MODULES
+
+# Modules beginner exercises may import; everything else waits for later levels
+BEGINNER_MODULES = ('math', 'random', 'string', 'time')
+
+@dataclass(frozen=True)
+class SandboxProfile:
+    """Execution limits an exercise runs under
+
+    Exercises override any of these fields with a "sandbox" dictionary,
+    e.g. {"timeout": 10, "memory_limit_mb": 512}; the rest come from the
+    exercise's difficulty.
+    """
+    timeout: float = 5
+    memory_limit_mb: int = DEFAULT_LIMITS["memory_limit_mb"]
+    max_output_bytes: int = DEFAULT_LIMITS["max_output_bytes"]
+    allowed_modules: tuple = SANDBOX_MODULES
+    line_budget: Optional[int] = DEFAULT_LIMITS["line_budget"]
+
+    def to_limits(self) -> Dict[str, Any]:
+        """Keyword arguments for execute_code and iter_test_results"""
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+DEFAULT_PROFILE = SandboxProfile()
+
+# Beginner programs are short, so they get tight and cheap limits
+DIFFICULTY_PROFILES = {
+    "beginner": SandboxProfile(
+        timeout=2,
+        memory_limit_mb=64,
+        max_output_bytes=16 * 1024,
+        allowed_modules=BEGINNER_MODULES
+    ),
+    "intermediate": SandboxProfile(memory_limit_mb=128),
+    "advanced": DEFAULT_PROFILE,
+}
+
+_PROFILE_FIELDS = {field.name for field in fields(SandboxProfile)}
+
+# Resolved profiles keyed by (difficulty, sandbox overrides)
+_profile_cache = LRUCache(maxsize=256)
+
+def _build_profile(difficulty: str, overrides: Dict[str, Any]) -> SandboxProfile:
+    unknown = set(overrides) - _PROFILE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown sandbox setting(s): {', '.join(sorted(unknown))}")
+
+    overrides = dict(overrides)
+    if 'allowed_modules' in overrides:
+        unavailable = set(overrides['allowed_modules']) - set(SANDBOX_MODULES)
+        if unavailable:
+            raise ValueError(f"Module(s) not available in the sandbox: {', '.join(sorted(unavailable))}")
+        overrides['allowed_modules'] = tuple(sorted(overrides['allowed_modules']))
+    if 'timeout' in overrides and not overrides['timeout'] > 0:
+        raise ValueError("Sandbox timeout must be positive")
+
+    base = DIFFICULTY_PROFILES.get(difficulty, DEFAULT_PROFILE)
+    return replace(base, **overrides)
+
+def resolve_profile(exercise: Optional[Dict[str, Any]]) -> SandboxProfile:
+    """
+    Get the sandbox profile an exercise runs under
+
+    Args:
+        exercise: Exercise dictionary, optionally with a "sandbox" key
+
+    Returns:
+        Frozen profile, shared by every exercise with the same settings
+
+    Raises:
+        ValueError: The "sandbox" key names unknown settings or modules
+    """
+    if not exercise:
+        return DEFAULT_PROFILE
+
+    difficulty = exercise.get('difficulty', '').lower()
+    overrides = exercise.get('sandbox') or {}
+    key = (difficulty, json.dumps(overrides, sort_keys=True))
+    return _profile_cache.get_or_compute(key, lambda: _build_profile(difficulty, overrides))
@@ -65,6 +65,7 @@ print(result)""",
                     "expected": ""
                 }
             ],
+            "sandbox": {"timeout": 10, "memory_limit_mb": 512},
             "tags": ["data-science", "analysis", "dictionaries", "lists"]
         },
         {
@@ -127,8 +128,14 @@ print(stats)""",
                 {
                     "test": "result = calculate_stats([1, 2, 2, 3, 4, 4, 5])\nassert abs(result['mean'] - 3.0) < 0.01\nassert result['median'] == 3\nassert result['range'] == 4",
                     "expected": ""
+                },
+                {
+                    "test": "numbers = [i % 100 for i in range(5000)] + [42]\nresult = calculate_stats(numbers)\nassert result['mode'] == 42\nassert result['range'] == 99",
+                    "expected": "",
+                    "budget": {"time": 10, "memory": 4}
                 }
             ],
+            "sandbox": {"timeout": 10, "memory_limit_mb": 512},
             "tags": ["data-science", "statistics", "algorithms"]
         },
         {
@@ -217,6 +224,7 @@ for user in cleaned:
                     "expected": ""
                 }
             ],
+            "sandbox": {"timeout": 10, "memory_limit_mb": 512},
             "tags": ["data-science", "data-cleaning", "validation"]
         }
     ]
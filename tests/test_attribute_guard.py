@@ -0,0 +1,44 @@
+"""
+Tests that attribute names built at runtime cannot reach what obj.name could not
+"""
+
+import pytest
+
+from code_executor import execute_code, validate_code_safety
+
+ESCAPE = (
+    'import json; g = getattr(json.dumps, "__glo"+"bals__"); '
+    'os = g["__built"+"ins__"]["__imp"+"ort__"]("o"+"s"); print(os.popen("id").read())'
+)
+
+RUNTIME_ESCAPES = {
+    "getattr alias": 'import json\ng = getattr\ng(json.dumps, "__glo" + "bals__")',
+    "attrgetter": 'import json, operator\noperator.attrgetter("__glo" + "bals__")(json.dumps)',
+    "methodcaller": 'import operator\noperator.methodcaller("__subcl" + "asses__")(object)',
+    "private setattr": 'class A:\n    pass\ns = setattr\ns(A(), "_" + "x", 1)',
+}
+
+def test_computed_attribute_name_is_refused_statically():
+    safety = validate_code_safety(ESCAPE)
+    assert not safety["is_safe"]
+    assert execute_code(ESCAPE)["limit_exceeded"] == "unsafe"
+
+def test_literal_attribute_names_are_allowed():
+    source = 'class A:\n    pass\na = A()\nsetattr(a, "x", 1)\nprint(getattr(a, "x"), hasattr(a, "y"))'
+    result = execute_code(source)
+    assert result["success"], result["error"]
+    assert result["output"] == "1 False\n"
+
+def test_own_getattr_is_not_refused():
+    assert validate_code_safety("def getattr(obj, name):\n    return name\nkey = 'a'\ngetattr(1, key)")["is_safe"]
+
+@pytest.mark.parametrize("source", RUNTIME_ESCAPES.values(), ids=RUNTIME_ESCAPES.keys())
+def test_runtime_check_refuses_private_names(source):
+    assert validate_code_safety(source)["is_safe"]
+    result = execute_code(source)
+    assert not result["success"]
+    assert "is not available in the practice sandbox" in result["error"]
+
+def test_hasattr_hides_private_names():
+    result = execute_code('h = hasattr\nprint(h(1, "__cl" + "ass__"))')
+    assert result["output"] == "False\n"
@@ -0,0 +1,35 @@
+"""
+Tests for batch test cases, which check one function against many argument vectors
+"""
+
+from code_executor import run_tests
+
+CODE = "def add(a, b):\n    return a + b if a < 10 else a - b"
+
+def test_mismatched_vector_fails_the_test():
+    test = {"function": "add", "args": [[1, 2], [10, 5], [3, 4]], "returns": [3, 15, 7]}
+    detail = run_tests(CODE, [test], use_cache=False)["details"][0]
+    assert not detail["passed"]
+    assert detail["actual"] == "2 of 3 vectors passing"
+    assert [vector["passed"] for vector in detail["vectors"]] == [True, False, True]
+    assert detail["vectors"][1]["args"] == "10, 5"
+    assert detail["vectors"][1]["expected"] == "15"
+    assert detail["vectors"][1]["actual"] == "5"
+
+def test_reference_computes_expected_values():
+    test = {"function": "add", "args": [[1, 2], [10, 5]], "reference": "def add(a, b):\n    return a + b"}
+    detail = run_tests(CODE, [test], use_cache=False)["details"][0]
+    assert [vector["passed"] for vector in detail["vectors"]] == [True, False]
+
+def test_floats_and_tuples_match_loosely():
+    code = "def split(x):\n    return (x / 3, x % 3)"
+    test = {"function": "split", "args": [[1], [7]], "returns": [[1 / 3, 1], [2.3333333333333335, 1]]}
+    detail = run_tests(code, [test], use_cache=False)["details"][0]
+    assert detail["passed"]
+
+def test_exception_marks_only_its_vector():
+    code = "def invert(x):\n    return 1 / x"
+    test = {"function": "invert", "args": [[1], [0]], "returns": [1.0, 0]}
+    detail = run_tests(code, [test], use_cache=False)["details"][0]
+    assert detail["vectors"][0]["passed"]
+    assert detail["vectors"][1]["error"].startswith("ZeroDivisionError")
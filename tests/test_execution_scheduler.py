@@ -0,0 +1,75 @@
+"""
+Tests for the priority lanes, backpressure and per-session cap of the execution scheduler
+"""
+
+import time
+import threading
+
+import pytest
+
+from execution_scheduler import ExecutionScheduler, SchedulerBusy
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the scheduler"
+        time.sleep(0.01)
+
+def queued(scheduler: ExecutionScheduler) -> int:
+    return sum(lane["queued"] for lane in scheduler.stats()["lanes"].values())
+
+def start_waiter(scheduler: ExecutionScheduler, lane: str, admitted: list, session_id=None) -> threading.Thread:
+    def run():
+        with scheduler.slot(lane, session_id):
+            admitted.append(lane if session_id is None else session_id)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def test_higher_lane_is_admitted_first():
+    scheduler = ExecutionScheduler(capacity=1)
+    admitted = []
+    with scheduler.slot("interactive"):
+        threads = [start_waiter(scheduler, "batch", admitted)]
+        wait_until(lambda: queued(scheduler) == 1)
+        threads.append(start_waiter(scheduler, "submit", admitted))
+        wait_until(lambda: queued(scheduler) == 2)
+        threads.append(start_waiter(scheduler, "interactive", admitted))
+        wait_until(lambda: queued(scheduler) == 3)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert admitted == ["interactive", "submit", "batch"]
+
+def test_full_lane_rejects_immediately():
+    scheduler = ExecutionScheduler(capacity=1, max_queued={"batch": 1})
+    with scheduler.slot("interactive"):
+        thread = start_waiter(scheduler, "batch", [])
+        wait_until(lambda: queued(scheduler) == 1)
+        with pytest.raises(SchedulerBusy):
+            with scheduler.slot("batch"):
+                pass
+    thread.join(timeout=5)
+    assert scheduler.stats()["lanes"]["batch"]["rejected"] == 1
+
+def test_request_waiting_too_long_is_rejected():
+    scheduler = ExecutionScheduler(capacity=1, max_wait={"submit": 0.05})
+    with scheduler.slot("interactive"):
+        with pytest.raises(SchedulerBusy):
+            with scheduler.slot("submit"):
+                pass
+    assert queued(scheduler) == 0
+
+def test_session_cannot_take_a_second_slot():
+    scheduler = ExecutionScheduler(capacity=2)
+    admitted = []
+    with scheduler.slot("interactive", session_id="alice"):
+        # The second request from alice waits although a slot is free,
+        # and does not hold up bob queued behind it
+        alice = start_waiter(scheduler, "interactive", admitted, session_id="alice")
+        wait_until(lambda: queued(scheduler) == 1)
+        bob = start_waiter(scheduler, "interactive", admitted, session_id="bob")
+        bob.join(timeout=5)
+        assert admitted == ["bob"]
+        assert queued(scheduler) == 1
+    alice.join(timeout=5)
+    assert admitted == ["bob", "alice"]
@@ -0,0 +1,54 @@
+"""
+Tests that only reproducible grading verdicts are replayed from the cache
+"""
+
+import pytest
+
+import code_executor
+from code_executor import run_tests, configure_pool, _is_cacheable, _worker_failure_result
+from execution_scheduler import ExecutionScheduler, SchedulerBusy
+from execution_watchdog import ExecutionCancelled
+
+CODE = "def double(x):\n    return 2 * x"
+TESTS = [{"test": "print(double(2))", "expected": "4"}]
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    previous = code_executor._pool_workers
+    configure_pool(1)
+    code_executor._grading_cache.clear()
+    yield
+    code_executor._grading_cache.clear()
+    configure_pool(previous)
+
+def cached_entries() -> int:
+    return code_executor.get_grading_cache_stats()["size"]
+
+def test_passing_run_is_replayed():
+    assert not run_tests(CODE, TESTS)["program"].get("cached")
+    result = run_tests(CODE + "\n\n# reformatted", TESTS)
+    assert result["program"]["cached"]
+    assert result["passed"] == 1
+
+def test_timeout_is_not_cached():
+    result = run_tests("while True: pass", TESTS, timeout=0.3)
+    assert result["passed"] == 0
+    assert cached_entries() == 0
+
+def test_busy_is_not_cached():
+    # A scheduler that turns every submission away
+    code_executor._scheduler = ExecutionScheduler(capacity=1, max_queued={"submit": 0})
+    result = run_tests(CODE, TESTS)
+    assert result["program"]["limit_exceeded"] == "busy"
+    assert cached_entries() == 0
+
+@pytest.mark.parametrize("error", [SchedulerBusy("full"), ExecutionCancelled()], ids=["busy", "cancelled"])
+def test_turned_away_results_are_not_cacheable(error):
+    result = _worker_failure_result(error)
+    assert not _is_cacheable(result, [result])
+
+@pytest.mark.parametrize("module", ["random", "time", "datetime"])
+def test_nondeterministic_code_is_not_cached(module):
+    result = run_tests(f"import {module}\n" + CODE, TESTS)
+    assert result["passed"] == 1
+    assert cached_entries() == 0
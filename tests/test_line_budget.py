@@ -0,0 +1,65 @@
+"""
+Tests for the executed-line budget on its sys.settrace and sys.monitoring paths
+"""
+
+import sys
+
+import pytest
+
+import code_executor
+from code_executor import _LineBudget, LineBudgetExceeded, compile_code, execute_code, configure_pool
+
+PROGRAMS = [
+    "while True: pass",
+    "for i in range(100): pass",
+    "x = 0\nfor i in range(10):\n    x += i",
+    "i = 0\nwhile i < 5:\n    i += 1",
+    "def g():\n    for i in range(3):\n        yield i\ntotal = sum(g())",
+    "squares = [n * n for n in range(20)]",
+    "def f(n):\n    return n if n < 2 else f(n - 1) + f(n - 2)\nf(6)",
+    "try:\n    1 / 0\nexcept ZeroDivisionError:\n    pass",
+]
+
+PATHS = [False]
+if hasattr(sys, 'monitoring'):
+    PATHS.append(True)
+
+def count_lines(source: str, monitoring: bool, budget: int = 10_000) -> int:
+    line_budget = _LineBudget(budget, monitoring=monitoring)
+    try:
+        with line_budget:
+            exec(compile_code(source), {})
+    except LineBudgetExceeded:
+        pass
+    return line_budget.lines
+
+@pytest.fixture(params=[0, 1], ids=["in-process", "pool"])
+def pool_workers(request):
+    previous = code_executor._pool_workers
+    configure_pool(request.param)
+    yield request.param
+    configure_pool(previous)
+
+@pytest.mark.parametrize("monitoring", PATHS, ids=lambda monitoring: "monitoring" if monitoring else "settrace")
+def test_one_line_loops_use_up_the_budget(monitoring):
+    assert count_lines("while True: pass", monitoring, budget=1000) == 1001
+    assert count_lines("for i in range(100): pass", monitoring) == 101
+
+@pytest.mark.skipif(not hasattr(sys, 'monitoring'), reason="sys.monitoring needs Python 3.12+")
+@pytest.mark.parametrize("source", PROGRAMS)
+def test_both_paths_count_the_same(source):
+    assert count_lines(source, monitoring=True) == count_lines(source, monitoring=False)
+
+def test_budget_stops_infinite_loop(pool_workers):
+    result = execute_code("while True: pass", timeout=5, line_budget=1000)
+    assert result["limit_exceeded"] == "line_budget"
+    assert result["lines_executed"] == 1001
+
+def test_budget_still_counts_after_a_timeout(pool_workers):
+    result = execute_code("while True: pass", timeout=0.5, line_budget=10 ** 9)
+    assert result["limit_exceeded"] == "timeout"
+
+    result = execute_code("print(2)", timeout=5, line_budget=100)
+    assert result["success"]
+    assert result["output"] == "2\n"
+    assert result["lines_executed"] == 1
@@ -0,0 +1,22 @@
+"""
+Tests that learner code can define and use classes inside the sandbox
+"""
+
+import pytest
+
+from code_executor import execute_code
+
+PROGRAMS = {
+    "class": ("class Point:\n    def __init__(self, x):\n        self.x = x\nprint(Point(3).x)", "3"),
+    "super": ("class A:\n    def f(self):\n        return 1\nclass B(A):\n    def f(self):\n        return super().f() + 1\nprint(B().f())", "2"),
+    "context manager": ("class Tag:\n    def __enter__(self):\n        print('<b>')\n    def __exit__(self, *exc):\n        print('</b>')\nwith Tag():\n    print('hi')", "<b>\nhi\n</b>"),
+    "dataclass": ("from dataclasses import dataclass\n@dataclass\nclass P:\n    x: int\nprint(P(1))", "P(x=1)"),
+    "enum": ("from enum import Enum\nclass Color(Enum):\n    RED = 1\nprint(Color(1).name)", "RED"),
+    "property": ("class A:\n    @property\n    def v(self):\n        return 5\nprint(A().v)", "5"),
+}
+
+@pytest.mark.parametrize("source, expected", PROGRAMS.values(), ids=PROGRAMS.keys())
+def test_class_programs_run(source, expected):
+    result = execute_code(source)
+    assert result["success"], result["error"]
+    assert result["output"].strip() == expected
@@ -0,0 +1,28 @@
+"""
+Tests that nothing one pool job does to a sandbox module reaches the next
+"""
+
+import pytest
+
+import code_executor
+from code_executor import execute_code, run_tests, configure_pool
+
+PATCH = "from collections import Counter\nCounter.most_common = lambda self, n=None: [('hacked', 0)]"
+USE = "from collections import Counter\ndef top(s):\n    return Counter(s).most_common(1)[0][0]"
+
+@pytest.fixture
+def one_worker():
+    previous = code_executor._pool_workers
+    configure_pool(1)
+    yield
+    configure_pool(previous)
+
+def test_patched_class_does_not_leak_into_the_next_run(one_worker):
+    assert execute_code(PATCH)["success"]
+    result = execute_code(USE + "\nprint(top('aab'))")
+    assert result["output"] == "a\n"
+
+def test_patched_class_does_not_leak_into_grading(one_worker):
+    run_tests(PATCH, [{"test": "print(1)", "expected": "1"}], use_cache=False)
+    result = run_tests(USE, [{"test": "print(top('aab'))", "expected": "a"}], use_cache=False)
+    assert result["passed"] == 1